@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import sys
+import time
+import subprocess
+import click
+
+# command line of each subcommand, and the module it imports when it runs
+SUBCOMMANDS = {
+    "--help": ((), None),
+    "create": (("create",), "soundfactory.create"),
+    "view": (("view",), "soundfactory.view"),
+    "play": (("play",), "soundfactory.play"),
+    "transform": (("transform",), "soundfactory.image_base"),
+    "cache": (("cache", "stats"), "soundfactory.cache"),
+    "bench": (("bench",), "soundfactory.bench"),
+}
+TARGET = .15
+
+
+def best_run(args, repeat=5):
+    """ Best wall time of a fresh interpreter running args """
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable] + list(args),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_startup(subcommand, repeat=5):
+    """
+    Time the --help of a subcommand, which only builds the CLI, and
+    the import of the module it loads to run
+
+    """
+    words, module = SUBCOMMANDS[subcommand]
+    help_time = best_run(("-m", "soundfactory.cli") + words + ("--help",), repeat=repeat)
+    if module is None:
+        return help_time, None
+    import_time = best_run(("-c", "import " + module), repeat=repeat)
+    return help_time, import_time
+
+
+@click.command()
+@click.option(
+    "--subcommand", "-c", "subcommands",
+    default=tuple(SUBCOMMANDS), multiple=True,
+    type=click.Choice(tuple(SUBCOMMANDS)))
+@click.option("--repeat", "-r", default=5, type=click.INT)
+def main(subcommands, repeat):
+    """
+    Benchmark the startup time of the soundfactory subcommands
+    """
+    row = "{:>10} {:>10} {:>12} {:>8}"
+    click.echo(row.format("command", "help [ms]", "import [ms]", "target"))
+    for subcommand in subcommands:
+        help_time, import_time = bench_startup(subcommand, repeat=repeat)
+        click.echo(row.format(
+            subcommand,
+            "{:.0f}".format(help_time * 1000),
+            "-" if import_time is None else "{:.0f}".format(import_time * 1000),
+            "ok" if help_time < TARGET else "slow"
+        ))
+
+
+if __name__ == "__main__":
+    main()
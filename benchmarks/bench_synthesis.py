@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+import time
+import click
+import numpy as np
+from soundfactory.cyutils import builder_utils as cy_builder_utils
+from soundfactory.settings.signal import B_N_COEFF_MAP
+
+
+def best_of(func, *args, repeat=3):
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_period_table(n_max, samplerate, duration, shape, repeat=3):
+    """
+    Time the per-sample upsample_component against the
+    single pass fourier_period kernel on the same period table
+
+    """
+    times = np.linspace(
+        0.0, duration, int(duration * samplerate), endpoint=False, dtype=np.float64
+    )
+    terms = np.arange(1, n_max + 1, dtype=np.int64)
+    coefficients = np.asarray(B_N_COEFF_MAP[shape](terms), dtype=np.float64)
+    args = (1., 0., duration, times, coefficients, terms)
+    old = best_of(cy_builder_utils.upsample_component, *args, repeat=repeat)
+    new = best_of(cy_builder_utils.fourier_period, *args, repeat=repeat)
+    return old, new
+
+
+@click.command()
+@click.option(
+    "--fourierterms", "-n", "n_max_values",
+    default=(10, 100, 1000), multiple=True,
+    metavar="N", type=click.INT)
+@click.option(
+    "--samplerate", "-s", "samplerates",
+    default=(22050, 44100, 96000), multiple=True,
+    metavar="SAMPLERATE", type=click.INT)
+@click.option(
+    "--duration", "-dur", default=.1,
+    metavar="DURATION", type=click.FLOAT)
+@click.option(
+    "--shape", default="square",
+    type=click.Choice(sorted(B_N_COEFF_MAP.keys())))
+@click.option("--repeat", "-r", default=3, type=click.INT)
+def main(n_max_values, samplerates, duration, shape, repeat):
+    """
+    Benchmark the period table synthesis over n_max and samplerate
+    """
+    row = "{:>6} {:>10} {:>14} {:>14} {:>9}"
+    click.echo(row.format("n_max", "samplerate", "per-sample [s]", "one-pass [s]", "speedup"))
+    for n_max in n_max_values:
+        for samplerate in samplerates:
+            old, new = bench_period_table(
+                n_max, samplerate, duration, shape, repeat=repeat)
+            click.echo(row.format(
+                n_max, samplerate,
+                "{:.4f}".format(old), "{:.4f}".format(new),
+                "{:.1f}x".format(old / new)
+            ))
+
+
+if __name__ == "__main__":
+    main()
@@ -36,7 +36,7 @@ setup(
     url="https://gitlab.com/babaMar/soundfactory",
     license='MIT',
     include_package_data=True,
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     install_requires=requirements,
     ext_modules=cythonize("soundfactory/cyutils/*.pyx"),
     tests_require=[tests_require],
@@ -1,4 +1,19 @@
-from .signal_base import Signal
-from .signal_builder import SignalBuilder
-from .signal_plotter import SignalPlotter
-from .image_base import SoundImage, Channel
+import importlib
+
+# The classes are imported on first use, so that each CLI subcommand
+# only loads the modules (matplotlib, scipy, PIL, ...) it needs
+_CLASS_MODULES = {
+    "Signal": ".signal_base",
+    "SignalBuilder": ".signal_builder",
+    "SignalPlotter": ".signal_plotter",
+    "SoundImage": ".image_base",
+    "Channel": ".image_base",
+}
+
+__all__ = list(_CLASS_MODULES)
+
+
+def __getattr__(name):
+    if name not in _CLASS_MODULES:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    return getattr(importlib.import_module(_CLASS_MODULES[name], __name__), name)
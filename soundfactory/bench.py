@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+
+import os
+import json
+import time
+import resource
+import tempfile
+from pathlib import Path
+from contextlib import contextmanager
+from multiprocessing import get_context
+
+import click
+import numpy as np
+
+from soundfactory.constants import BENCH_KINDS, BENCH_TOLERANCE
+from soundfactory.settings.signal import WAVE_SHAPES
+from soundfactory.settings.logging_settings import benchlog
+
+# samples and images shipped with the repository
+SAMPLES_DIR = Path(__file__).resolve().parent.parent / "samples"
+DEFAULT_GRID = {
+    "n_max": (10, 100, 1000),
+    "samplerate": (44100,),
+    "duration": (1.,),
+    "components": (1, 8),
+    "shape": ("sine", "square"),
+}
+# one image of each mode (rembrandt_rgba.jpg is empty)
+IMAGES = ("rembrandt_rgb.jpg", "rembrandt_rgba.png", "rembrandt_grey.jpg", "rembrandt_cmyk.jpg")
+# cases of the current run, inherited by the processes measuring them
+_CASES = list()
+
+
+class Case:
+    """
+    A benchmark: run() is timed, samples is the number of samples it
+    produces or reads, to report the throughput. Cold cases start every
+    run with empty caches, warm ones fill them with a first, untimed run
+    """
+
+    def __init__(self, name, run, samples, cold=False, setup=None):
+        self.name = name
+        self.run = run
+        self.samples = samples
+        self.cold = cold
+        self.setup = setup
+
+
+@contextmanager
+def isolated_caches():
+    """
+    Empty component, wavetable and SoundImage caches in a temporary
+    directory, in place of the configured ones for the block
+    """
+    from soundfactory.utils.cache import TieredCache, CacheStore, memory_cache
+    from soundfactory.signal_builder import CACHE, WAVETABLES
+    from soundfactory.image_base import BUILDER_CACHE
+    saved = [
+        (cache, cache.memory, cache.store)
+        for cache in (CACHE, WAVETABLES, BUILDER_CACHE)
+    ]
+    with tempfile.TemporaryDirectory() as path:
+        try:
+            for i, (cache, _, store) in enumerate(saved):
+                fresh = TieredCache(
+                    memory_cache(store.policy, cache.memory.maxsize, store.ttl),
+                    CacheStore(Path(path) / str(i), mmap=store.mmap,
+                               max_bytes=store.max_bytes,
+                               policy=store.policy, ttl=store.ttl)
+                )
+                cache.memory, cache.store = fresh.memory, fresh.store
+            yield
+        finally:
+            for cache, memory, store in saved:
+                cache.memory, cache.store = memory, store
+
+
+def builder_cases(grid):
+    from soundfactory.signal_builder import SignalBuilder
+    for n_max in grid["n_max"]:
+        for samplerate in grid["samplerate"]:
+            for duration in grid["duration"]:
+                for components in grid["components"]:
+                    for shape in grid["shape"]:
+                        # spread over a few octaves, as in a chord
+                        freqs = 110. * 2 ** (np.arange(components) / 7.)
+                        amps = [1. / components] * components
+
+                        def run(freqs=freqs, amps=amps, shape=shape, n_max=n_max,
+                                samplerate=samplerate, duration=duration):
+                            SignalBuilder(
+                                freqs, amps, [shape] * len(freqs),
+                                n_max=n_max, samplerate=samplerate, duration=duration
+                            ).render()
+
+                        name = "builder[n={},sr={},dur={:g},k={},{}]".format(
+                            n_max, samplerate, duration, components, shape)
+                        for cold in (True, False):
+                            yield Case(
+                                name + ("[cold]" if cold else "[warm]"), run,
+                                int(duration * samplerate), cold=cold)
+
+
+def signal_cases(samples_dir):
+    from soundfactory.signal_base import Signal
+    from soundfactory.utils.signal import load_audio
+
+    def run(path):
+        # the envelopes and spectra are only calculated when accessed
+        s = Signal(str(path), with_envelope=True)
+        list(s.ENVELOPES.values()), list(s.SPECTRA.values())
+
+    for path in sorted(Path(samples_dir).glob("*.wav")):
+        audio, _ = load_audio(str(path))
+        yield Case(
+            "signal[{}]".format(path.name), lambda path=path: run(path), audio.shape[0])
+
+
+def plotter_cases(samples_dir):
+    from soundfactory.utils.signal import load_audio
+
+    def setup():
+        import matplotlib
+        matplotlib.use("Agg")
+
+    def run(path):
+        from soundfactory.settings.plot import plt
+        from soundfactory.signal_plotter import SignalPlotter
+        with tempfile.TemporaryDirectory() as out:
+            cwd = os.getcwd()
+            os.chdir(out)
+            try:
+                SignalPlotter(plt, str(path), fname="bench").show(
+                    mode="single", savefigures=True)
+            finally:
+                os.chdir(cwd)
+                plt.close("all")
+
+    for path in sorted(Path(samples_dir).glob("*.wav")):
+        audio, _ = load_audio(str(path))
+        yield Case(
+            "plotter[{}]".format(path.name),
+            lambda path=path: run(path), audio.shape[0], setup=setup)
+
+
+def image_cases(samples_dir, samplerate=44100, duration=1.):
+    from soundfactory.image_base import SoundImage
+
+    def run(path):
+        with tempfile.TemporaryDirectory() as out:
+            image = SoundImage(str(path))
+            image.export_audio(
+                image.bands[0], path=str(Path(out) / "bench.wav"),
+                samplerate=samplerate, duration=duration)
+
+    for path in (Path(samples_dir) / "images" / name for name in IMAGES):
+        for cold in (True, False):
+            yield Case(
+                "image[{}][{}]".format(path.name, "cold" if cold else "warm"),
+                lambda path=path: run(path), int(samplerate * duration), cold=cold)
+
+
+def collect_cases(kinds, grid, samples_dir=SAMPLES_DIR):
+    cases = list()
+    if "builder" in kinds:
+        cases.extend(builder_cases(grid))
+    if "signal" in kinds:
+        cases.extend(signal_cases(samples_dir))
+    if "plotter" in kinds:
+        cases.extend(plotter_cases(samples_dir))
+    if "image" in kinds:
+        cases.extend(image_cases(
+            samples_dir, samplerate=grid["samplerate"][0], duration=grid["duration"][0]))
+    return cases
+
+
+def measure(case, repeat=3):
+    """
+    Best time of repeat runs of case, its throughput in samples per
+    second and the peak resident memory (in bytes) of the process
+    """
+    from soundfactory.utils.profiling import profile
+    if case.setup is not None:
+        case.setup()
+    timings = list()
+    with isolated_caches():
+        if not case.cold:
+            case.run()
+        for _ in range(repeat):
+            if case.cold:
+                with isolated_caches():
+                    with profile() as metrics:
+                        start = time.perf_counter()
+                        case.run()
+                        timings.append(time.perf_counter() - start)
+            else:
+                with profile() as metrics:
+                    start = time.perf_counter()
+                    case.run()
+                    timings.append(time.perf_counter() - start)
+    seconds = min(timings)
+    # kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return {
+        "seconds": seconds,
+        "throughput": case.samples / seconds,
+        "peak_rss": peak_rss,
+        "spans": {name: span["total"] for name, span in metrics.report()["spans"].items()},
+    }
+
+
+def _measure_forked(index, repeat):
+    return measure(_CASES[index], repeat=repeat)
+
+
+def run_cases(kinds, grid, samples_dir=SAMPLES_DIR, repeat=3):
+    """
+    Measure every case in a process of its own, forked from this one,
+    so that the peak memory of each case is its own
+    """
+    from soundfactory.utils.backends import machine_id
+    _CASES[:] = collect_cases(kinds, grid, samples_dir)
+    results = dict()
+    context = get_context("fork")
+    for index, case in enumerate(_CASES):
+        benchlog.info("Running {}".format(case.name))
+        with context.Pool(1) as pool:
+            results[case.name] = pool.apply(_measure_forked, (index, repeat))
+    return {"machine": machine_id(), "cases": results}
+
+
+def compare(results, baseline, tolerance=BENCH_TOLERANCE):
+    """
+    Ratio of the time of each case to its baseline time, and the names
+    of the cases more than tolerance slower
+    """
+    if baseline.get("machine") != results["machine"]:
+        benchlog.warning("The baseline was measured on {}, not on {}".format(
+            baseline.get("machine"), results["machine"]))
+    ratios, regressions = dict(), list()
+    for name, result in results["cases"].items():
+        reference = baseline["cases"].get(name)
+        if reference is None:
+            continue
+        ratios[name] = result["seconds"] / reference["seconds"]
+        if ratios[name] > 1 + tolerance:
+            regressions.append(name)
+    return ratios, regressions
+
+
+def format_results(results, ratios=None):
+    ratios = ratios or dict()
+    rows = [(
+        "case", "best [s]", "samples/s", "peak RSS [MiB]", "vs baseline")]
+    for name, result in results["cases"].items():
+        rows.append((
+            name,
+            "{:.4f}".format(result["seconds"]),
+            "{:.3g}".format(result["throughput"]),
+            "{:.1f}".format(result["peak_rss"] / 2 ** 20),
+            "{:.2f}x".format(ratios[name]) if name in ratios else "-",
+        ))
+    width = max(len(row[0]) for row in rows)
+    return "\n".join(
+        "{:<{w}} {:>10} {:>10} {:>15} {:>12}".format(*row, w=width) for row in rows)
+
+
+def bench(
+        kinds=BENCH_KINDS, grid=None, samples_dir=SAMPLES_DIR, repeat=3,
+        save=None, baseline=None, tolerance=BENCH_TOLERANCE
+):
+    """
+    Run the benchmarks, print the results, save them as a JSON baseline
+    and compare them with a saved one. Returns the regressed cases
+
+    """
+    grid = dict(DEFAULT_GRID, **(grid or dict()))
+    results = run_cases(kinds, grid, samples_dir, repeat=repeat)
+    ratios, regressions = dict(), list()
+    if baseline is not None:
+        with open(baseline) as f:
+            ratios, regressions = compare(results, json.load(f), tolerance=tolerance)
+    click.echo(format_results(results, ratios))
+    if save is not None:
+        with open(save, "w") as f:
+            json.dump(results, f, indent=2)
+        benchlog.info("Saved the results in {}".format(save))
+    for name in regressions:
+        benchlog.error("{} is {:.2f}x slower than the baseline".format(name, ratios[name]))
+    return regressions
+
+
+@click.command()
+@click.option(
+    "--kind", "kinds", default=BENCH_KINDS, multiple=True,
+    type=click.Choice(BENCH_KINDS), help="benchmarks to run")
+@click.option(
+    "--fourierterms", "-n", "n_max", multiple=True,
+    metavar="N", type=click.INT)
+@click.option(
+    "--samplerate", "-s", "samplerate", multiple=True,
+    metavar="SAMPLERATE", type=click.INT)
+@click.option(
+    "--duration", "-dur", "duration", multiple=True,
+    metavar="DURATION", type=click.FLOAT)
+@click.option(
+    "--components", "-k", "components", multiple=True,
+    metavar="K", type=click.IntRange(min=1), help="components of each signal")
+@click.option(
+    "--shape", "shape", multiple=True, type=click.Choice(WAVE_SHAPES))
+@click.option("--repeat", "-r", default=3, type=click.IntRange(min=1))
+@click.option(
+    "--save", metavar="PATH", type=click.Path(dir_okay=False),
+    help="save the results as a JSON baseline")
+@click.option(
+    "--baseline", metavar="PATH", type=click.Path(exists=True, dir_okay=False),
+    help="fail if a case is slower than in this saved baseline")
+@click.option(
+    "--tolerance", default=BENCH_TOLERANCE, type=click.FloatRange(min=0),
+    help="slowdown over the baseline allowed, as a fraction")
+def main(kinds, n_max, samplerate, duration, components, shape,
+         repeat, save, baseline, tolerance):
+    """
+    Benchmark the synthesis, analysis, plots and images
+    """
+    grid = {
+        key: values for key, values in (
+            ("n_max", n_max), ("samplerate", samplerate), ("duration", duration),
+            ("components", components), ("shape", shape)
+        ) if values
+    }
+    regressions = bench(
+        kinds, grid, repeat=repeat, save=save, baseline=baseline, tolerance=tolerance)
+    if regressions:
+        raise click.ClickException(
+            "{} cases slower than the baseline".format(len(regressions)))
+
+
+if __name__ == "__main__":
+    main()
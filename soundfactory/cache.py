@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+import time
+import click
+import numpy as np
+from soundfactory.utils.cache import configured_cache
+from soundfactory.utils.scale import build_24_tet_scale, label_info_re
+from soundfactory.settings.config import (
+    SIGNAL_CACHE_DIR, WAVETABLE_CACHE_DIR, BUILDER_CACHE_DIR
+)
+from soundfactory.settings.signal import WAVE_SHAPES
+from soundfactory.settings.logging_settings import cachelog
+
+# stats and prune open the caches by path: the modules using them
+# (and matplotlib, scipy, PIL) are only imported by warm
+CACHE_DIRS = {
+    "components": SIGNAL_CACHE_DIR,
+    "wavetables": WAVETABLE_CACHE_DIR,
+    "images": BUILDER_CACHE_DIR,
+}
+# upper bounds (in seconds) of the age histogram buckets
+AGE_BUCKETS = (
+    ("1 hour", 3600),
+    ("1 day", 86400),
+    ("1 week", 7 * 86400),
+    ("30 days", 30 * 86400),
+    ("older", np.inf),
+)
+
+
+def warm(
+        init_label, init_freq, max_octave, shapes, n_max_values, samplerates,
+        duration, workers=None
+):
+    """
+    Render and cache the unit-amplitude components of the 24-TET scale
+    from init_label (at init_freq) up to max_octave, for every shape,
+    n_max and samplerate, and the wavetables they are read from. The
+    components serve renders of the same notes and phases at any
+    amplitude, the wavetables any render of the same shapes and n_max
+
+    """
+    from soundfactory.signal_builder import SignalBuilder
+    tone, octave, _ = label_info_re(init_label)
+    # octaves go from C to B: the scale must reach G of max_octave
+    if (int(octave), tone in "AB") > (max_octave, False):
+        raise ValueError("{} is above G{}".format(init_label, max_octave))
+    freqs = list(build_24_tet_scale(init_label, init_freq, max_octave=max_octave).values())
+    cachelog.info("Warming the cache with {} frequencies from {} hz".format(
+        len(freqs), init_freq))
+    for shape in shapes:
+        for n_max in n_max_values:
+            for samplerate in samplerates:
+                cachelog.info("Rendering {} waves, n_max {}, samplerate {}".format(
+                    shape, n_max, samplerate))
+                SignalBuilder(
+                    freqs, [1.] * len(freqs), [shape] * len(freqs),
+                    n_max=n_max,
+                    samplerate=samplerate,
+                    duration=duration,
+                    workers=workers
+                ).build_signal()
+
+
+def age_histogram(cache, now=None):
+    """ Number of entries of the cache in each of the AGE_BUCKETS """
+    now = time.time() if now is None else now
+    ages = [now - entry.get("time", 0.) for entry in cache.store.index.values()]
+    bounds = [0.] + [bound for _, bound in AGE_BUCKETS]
+    counts, _ = np.histogram(ages, bins=bounds)
+    return {label: int(count) for (label, _), count in zip(AGE_BUCKETS, counts)}
+
+
+def stats(cache):
+    """ Entries, bytes, hit ratio and age of the entries of a cache """
+    saved = cache.store.saved_stats()
+    report = {
+        "entries": len(cache),
+        "bytes": cache.store.nbytes(),
+        "max_bytes": cache.store.max_bytes,
+        "ages": age_histogram(cache),
+    }
+    for layer in ("memory", "disk"):
+        counts = saved.get(layer, dict())
+        hits, misses = counts.get("hits", 0), counts.get("misses", 0)
+        report[layer] = dict(
+            counts, hit_ratio=hits / (hits + misses) if hits + misses else None)
+    return report
+
+
+def show_stats():
+    for name, path in CACHE_DIRS.items():
+        report = stats(configured_cache(path))
+        click.echo("{}: {} entries, {:.1f} MiB of {:.1f} MiB".format(
+            name, report["entries"],
+            report["bytes"] / 2 ** 20, report["max_bytes"] / 2 ** 20))
+        for layer in ("memory", "disk"):
+            counts = report[layer]
+            click.echo("  {:<6} hits {} misses {} evictions {} expirations {} hit ratio {}".format(
+                layer,
+                counts.get("hits", 0), counts.get("misses", 0),
+                counts.get("evictions", 0), counts.get("expirations", 0),
+                "-" if counts["hit_ratio"] is None else "{:.1%}".format(counts["hit_ratio"])
+            ))
+        click.echo("  age    " + ", ".join(
+            "{} {}".format(count, "older" if label == "older" else "< " + label)
+            for label, count in report["ages"].items()))
+
+
+def prune(max_age=None, max_bytes=None):
+    """ Evict the entries older than max_age seconds, then until max_bytes are left """
+    for name, path in CACHE_DIRS.items():
+        store = configured_cache(path).store
+        evicted = store.prune(max_age=max_age, max_bytes=max_bytes)
+        store.compact()
+        cachelog.info("Evicted {} {} entries, {} bytes left".format(
+            evicted, name, store.nbytes()))
+
+
+@click.group()
+def main():
+    pass
+
+
+@main.command("warm")
+@click.option(
+    "--from", "start", nargs=2, default=("A0", 27.5),
+    metavar="LABEL FREQ", type=(str, float),
+    help="lowest note of the scale and its frequency")
+@click.option(
+    "--max-octave", default=8,
+    metavar="OCTAVE", type=click.INT,
+    help="the scale goes up to G of this octave")
+@click.option(
+    "--shape", "shapes", default=("sine",), multiple=True,
+    type=click.Choice(WAVE_SHAPES))
+@click.option(
+    "--fourierterms", "-n", "n_max_values", default=(100,), multiple=True,
+    metavar="N", type=click.INT)
+@click.option(
+    "--samplerate", "-s", "samplerates", default=(44100,), multiple=True,
+    metavar="SAMPLERATE", type=click.INT)
+@click.option(
+    "--duration", "-dur", default=2.,
+    metavar="DURATION", type=click.FLOAT)
+@click.option(
+    "--jobs", "-j", default=0,
+    metavar="N", type=click.IntRange(min=0),
+    help="components rendered in parallel, 0 to use all the cores")
+def warm_command(start, max_octave, shapes, n_max_values, samplerates, duration, jobs):
+    warm(*start, max_octave, shapes, n_max_values, samplerates, duration,
+         workers=jobs or None)
+
+
+@main.command("stats")
+def stats_command():
+    show_stats()
+
+
+@main.command("prune")
+@click.option(
+    "--older-than", metavar="DAYS", type=click.FloatRange(min=0),
+    help="evict the entries created more than DAYS ago")
+@click.option(
+    "--max-bytes", metavar="BYTES", type=click.IntRange(min=0),
+    help="then evict entries, following the cache policy, down to BYTES")
+def prune_command(older_than, max_bytes):
+    prune(
+        max_age=None if older_than is None else older_than * 86400,
+        max_bytes=max_bytes
+    )
+
+
+if __name__ == "__main__":
+    main()
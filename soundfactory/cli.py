@@ -1,17 +1,41 @@
 import click
-from .view import view as vv
-from .create import create as cc
-from .play import play as pp
 from .settings.input_validators import (
     ExistentWav, Wav, ArbitraryNArgs, WaveComponent
 )
-from .settings.plot import AMP_THRESHOLD
-from .image_base import SoundImage
+from .constants import (
+    AMP_THRESHOLD, DEFAULT_LOOP_TOLERANCE, BENCH_KINDS, BENCH_TOLERANCE,
+    DEFAULT_BLOCK_SIZE, DEFAULT_WELCH_SEGMENT, DEFAULT_WELCH_OVERLAP,
+    DEFAULT_WELCH_WINDOW
+)
+from .settings.signal import (
+    SYNTHESIS_ENGINES, SYNTHESIS_BACKENDS, SYNTHESIS_DTYPES,
+    INTERPOLATION_ORDERS, WAVE_SHAPES
+)
+
+# Each command imports its implementation when it runs: numpy,
+# matplotlib, scipy and PIL are only loaded by the commands using them
 
 
 @click.group()
-def main():
-    pass
+@click.option(
+    "--profile", is_flag=True,
+    help="print the time spent in each step of the command")
+@click.option(
+    "--metrics-json", metavar="PATH", type=click.Path(dir_okay=False),
+    help="save the timings and counters of the command in PATH")
+@click.pass_context
+def main(ctx, profile, metrics_json):
+    if profile or metrics_json:
+        from .utils.profiling import profile as record
+        metrics = ctx.with_resource(record())
+
+        def report():
+            if profile:
+                click.echo(metrics.format(), err=True)
+            if metrics_json:
+                metrics.save(metrics_json)
+
+        ctx.call_on_close(report)
 
 
 @main.command()
@@ -42,18 +66,43 @@ def main():
     help="amplitude percentage threshold")
 @click.option("--log-pws", flag_value="log_pws", default=False)
 @click.option("--save-fig", is_flag=True)
+@click.option(
+    "--mmap", is_flag=True,
+    help="map uncompressed wav files in memory instead of reading them")
+@click.option(
+    "--welch", is_flag=True,
+    help="average the spectra of overlapping segments (for long files)")
+@click.option(
+    "--segment", default=DEFAULT_WELCH_SEGMENT,
+    metavar="N", type=click.IntRange(min=1),
+    help="samples of each segment averaged by --welch")
+@click.option(
+    "--overlap", default=DEFAULT_WELCH_OVERLAP,
+    metavar="FRACTION", type=click.FloatRange(min=0, max=1, max_open=True),
+    help="fraction of each segment shared with the next one")
+@click.option(
+    "--window", default=DEFAULT_WELCH_WINDOW,
+    metavar="WINDOW", help="window of the segments, as named by scipy")
+@click.option(
+    "--block-size", default=DEFAULT_BLOCK_SIZE,
+    metavar="N", type=click.IntRange(min=1),
+    help="samples read at a time by --welch")
 def view(
         input_file, calculate_envelope,
         msec_window, start, end, mode,
         min_freq, max_freq,
-        threshold, log_pws, save_fig
+        threshold, log_pws, save_fig, mmap,
+        welch, segment, overlap, window, block_size
 ):
+    from .view import view as vv
     vv(
         input_file, calculate_envelope,
         msec_window, start, end, mode,
         min_freq, max_freq,
-        threshold, log_pws, save_fig
-
+        threshold, log_pws, save_fig, mmap=mmap,
+        welch=dict(
+            nperseg=segment, overlap=overlap, window=window,
+            block_size=block_size) if welch else None
     )
 
 
@@ -81,8 +130,58 @@ def view(
     "--fourierterms", "-n", default=100,
     metavar="N", type=click.INT
 )
-def create(wave_component, out, samplerate, duration, fourierterms):
-    cc(wave_component, out, samplerate, duration, fourierterms)
+@click.option(
+    "--engine", default="series",
+    type=click.Choice(SYNTHESIS_ENGINES),
+    help="synthesis engine: time-domain series or single inverse FFT"
+)
+@click.option(
+    "--nyquist-guard", default=None,
+    metavar="FRACTION", type=click.FloatRange(0, 1, max_open=True),
+    help="drop harmonics above (1 - FRACTION) * samplerate / 2"
+)
+@click.option(
+    "--interpolation", default="linear",
+    type=click.Choice(tuple(INTERPOLATION_ORDERS)),
+    help="interpolation between wavetable points"
+)
+@click.option(
+    "--jobs", "-j", default=1,
+    metavar="N", type=click.IntRange(min=0),
+    help="components rendered in parallel, 0 to use all the cores"
+)
+@click.option(
+    "--backend", default=None,
+    type=click.Choice(SYNTHESIS_BACKENDS + ("auto",)),
+    help="synthesis kernels, defaults to $SOUNDFACTORY_BACKEND or cython"
+)
+@click.option(
+    "--dtype", default="float64",
+    type=click.Choice(SYNTHESIS_DTYPES),
+    help="sample format used to render the signal"
+)
+@click.option(
+    "--loop", is_flag=True,
+    help="render one common period, tile it and save the loop points"
+)
+@click.option(
+    "--loop-tolerance", default=DEFAULT_LOOP_TOLERANCE,
+    metavar="CYCLES", type=click.FloatRange(min=0),
+    help="phase error allowed at the loop point"
+)
+def create(
+        wave_component, out, samplerate, duration, fourierterms,
+        engine, nyquist_guard, interpolation, jobs, backend, dtype,
+        loop, loop_tolerance
+):
+    from .create import create as cc
+    cc(
+        wave_component, out, samplerate, duration, fourierterms,
+        engine=engine, nyquist_guard=nyquist_guard,
+        interpolation=interpolation, workers=jobs or None,
+        backend=backend, dtype=dtype,
+        loop=loop, loop_tolerance=loop_tolerance
+    )
 
 
 @main.command()
@@ -104,6 +203,7 @@ def create(wave_component, out, samplerate, duration, fourierterms):
     default=None
 )
 def transform(input_file, resolution, out_file):
+    from .image_base import SoundImage
     si = SoundImage(input_file, resolution=resolution)
     si.export_audio("R", path=out_file)
 
@@ -116,8 +216,118 @@ def transform(input_file, resolution, out_file):
     type=ExistentWav()
 )
 def play(input_file):
+    from .play import play as pp
     pp(input_file)
 
 
+@main.group()
+def cache():
+    """ Warm up, inspect and prune the synthesis caches """
+    pass
+
+
+@cache.command()
+@click.option(
+    "--from", "start", nargs=2, default=("A0", 27.5),
+    metavar="LABEL FREQ", type=(str, float),
+    help="lowest note of the scale and its frequency")
+@click.option(
+    "--max-octave", default=8,
+    metavar="OCTAVE", type=click.INT,
+    help="the scale goes up to G of this octave")
+@click.option(
+    "--shape", "shapes", default=("sine",), multiple=True,
+    type=click.Choice(WAVE_SHAPES))
+@click.option(
+    "--fourierterms", "-n", "n_max_values", default=(100,), multiple=True,
+    metavar="N", type=click.INT)
+@click.option(
+    "--samplerate", "-s", "samplerates", default=(44100,), multiple=True,
+    metavar="SAMPLERATE", type=click.INT)
+@click.option(
+    "--duration", "-dur", default=2.,
+    metavar="DURATION", type=click.FLOAT)
+@click.option(
+    "--jobs", "-j", default=0,
+    metavar="N", type=click.IntRange(min=0),
+    help="components rendered in parallel, 0 to use all the cores"
+)
+def warm(start, max_octave, shapes, n_max_values, samplerates, duration, jobs):
+    """ Render the components of a 24-TET scale ahead of a job """
+    from .cache import warm as cw
+    cw(
+        *start, max_octave, shapes, n_max_values, samplerates, duration,
+        workers=jobs or None
+    )
+
+
+@cache.command()
+def stats():
+    """ Entries, bytes, hit ratios and ages of the cached entries """
+    from .cache import show_stats as cs
+    cs()
+
+
+@cache.command()
+@click.option(
+    "--older-than", metavar="DAYS", type=click.FloatRange(min=0),
+    help="evict the entries created more than DAYS ago")
+@click.option(
+    "--max-bytes", metavar="BYTES", type=click.IntRange(min=0),
+    help="then evict entries, following the cache policy, down to BYTES")
+def prune(older_than, max_bytes):
+    """ Evict cached entries by age or size """
+    from .cache import prune as cp
+    cp(
+        max_age=None if older_than is None else older_than * 86400,
+        max_bytes=max_bytes
+    )
+
+
+@main.command()
+@click.option(
+    "--kind", "kinds", default=BENCH_KINDS, multiple=True,
+    type=click.Choice(BENCH_KINDS), help="benchmarks to run")
+@click.option(
+    "--fourierterms", "-n", "n_max", multiple=True,
+    metavar="N", type=click.INT)
+@click.option(
+    "--samplerate", "-s", "samplerate", multiple=True,
+    metavar="SAMPLERATE", type=click.INT)
+@click.option(
+    "--duration", "-dur", "duration", multiple=True,
+    metavar="DURATION", type=click.FLOAT)
+@click.option(
+    "--components", "-k", "components", multiple=True,
+    metavar="K", type=click.IntRange(min=1), help="components of each signal")
+@click.option(
+    "--shape", "shape", multiple=True, type=click.Choice(WAVE_SHAPES))
+@click.option("--repeat", "-r", default=3, type=click.IntRange(min=1))
+@click.option(
+    "--save", metavar="PATH", type=click.Path(dir_okay=False),
+    help="save the results as a JSON baseline")
+@click.option(
+    "--baseline", metavar="PATH", type=click.Path(exists=True, dir_okay=False),
+    help="fail if a case is slower than in this saved baseline")
+@click.option(
+    "--tolerance", default=BENCH_TOLERANCE, type=click.FloatRange(min=0),
+    help="slowdown over the baseline allowed, as a fraction")
+def bench(kinds, n_max, samplerate, duration, components, shape,
+          repeat, save, baseline, tolerance):
+    """ Benchmark the synthesis, analysis, plots and images """
+    from .bench import bench as run
+    grid = {
+        key: values for key, values in (
+            ("n_max", n_max), ("samplerate", samplerate), ("duration", duration),
+            ("components", components), ("shape", shape)
+        ) if values
+    }
+    regressions = run(
+        kinds, grid, repeat=repeat, save=save, baseline=baseline, tolerance=tolerance)
+    if regressions:
+        raise click.ClickException(
+            "{} cases slower than the baseline".format(len(regressions)))
+
+
 if __name__ == "__main__":
     main()
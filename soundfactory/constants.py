@@ -26,3 +26,14 @@ MAX_16_BIT_VALUE = 2**15 - 1
 BYTE_PER_16_BIT = 2
 
 DEFAULT_SAMPLERATE = 44100
+DEFAULT_TABLE_SIZE = 2**16
+DEFAULT_BLOCK_SIZE = 2**16
+DEFAULT_LOOP_TOLERANCE = 1e-6
+DEFAULT_WELCH_SEGMENT = 2**14  # samples of each averaged periodogram
+DEFAULT_WELCH_OVERLAP = .5
+DEFAULT_WELCH_WINDOW = 'hann'
+
+AMP_THRESHOLD = .05  # percentage on max amplitude threshold
+
+BENCH_KINDS = ('builder', 'signal', 'plotter', 'image')
+BENCH_TOLERANCE = .2  # slowdown over the baseline reported as a regression
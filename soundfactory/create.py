@@ -6,10 +6,20 @@ from soundfactory import SignalBuilder
 from soundfactory.settings.input_validators import (Wav,
                                                     ArbitraryNArgs,
                                                     WaveComponent)
+from soundfactory.settings.signal import (SYNTHESIS_ENGINES,
+                                          SYNTHESIS_BACKENDS,
+                                          SYNTHESIS_DTYPES,
+                                          INTERPOLATION_ORDERS)
 from soundfactory.settings.logging_settings import createlog
+from soundfactory.constants import DEFAULT_LOOP_TOLERANCE
 
 
-def create(wave_component, out, samplerate, duration, n_max):
+def create(
+        wave_component, out, samplerate, duration, n_max,
+        engine="series", nyquist_guard=None, interpolation="linear",
+        workers=1, backend=None, dtype="float64", loop=False,
+        loop_tolerance=DEFAULT_LOOP_TOLERANCE
+):
     """
     Create a signal from given frequencies and amplitudes and
     save it on an out file
@@ -25,7 +35,15 @@ def create(wave_component, out, samplerate, duration, n_max):
         phases=phases,
         n_max=n_max,
         samplerate=samplerate,
-        duration=duration
+        duration=duration,
+        engine=engine,
+        nyquist_guard=nyquist_guard,
+        interpolation=interpolation,
+        workers=workers,
+        backend=backend,
+        dtype=dtype,
+        loop=loop,
+        loop_tolerance=loop_tolerance
     )
     createlog.info("Exporting signal")
     s.export(out)
@@ -54,8 +72,57 @@ def create(wave_component, out, samplerate, duration, n_max):
     "--fourierterms", "-n", default=100,
     metavar="N", type=click.INT
 )
-def main(wave_component, out, samplerate, duration, fourierterms):
-    create(wave_component, out, samplerate, duration, fourierterms)
+@click.option(
+    "--engine", default="series",
+    type=click.Choice(SYNTHESIS_ENGINES),
+    help="synthesis engine: time-domain series or single inverse FFT"
+)
+@click.option(
+    "--nyquist-guard", default=None,
+    metavar="FRACTION", type=click.FloatRange(0, 1, max_open=True),
+    help="drop harmonics above (1 - FRACTION) * samplerate / 2"
+)
+@click.option(
+    "--interpolation", default="linear",
+    type=click.Choice(tuple(INTERPOLATION_ORDERS)),
+    help="interpolation between wavetable points"
+)
+@click.option(
+    "--jobs", "-j", default=1,
+    metavar="N", type=click.IntRange(min=0),
+    help="components rendered in parallel, 0 to use all the cores"
+)
+@click.option(
+    "--backend", default=None,
+    type=click.Choice(SYNTHESIS_BACKENDS + ("auto",)),
+    help="synthesis kernels, defaults to $SOUNDFACTORY_BACKEND or cython"
+)
+@click.option(
+    "--dtype", default="float64",
+    type=click.Choice(SYNTHESIS_DTYPES),
+    help="sample format used to render the signal"
+)
+@click.option(
+    "--loop", is_flag=True,
+    help="render one common period, tile it and save the loop points"
+)
+@click.option(
+    "--loop-tolerance", default=DEFAULT_LOOP_TOLERANCE,
+    metavar="CYCLES", type=click.FloatRange(min=0),
+    help="phase error allowed at the loop point"
+)
+def main(
+        wave_component, out, samplerate, duration, fourierterms,
+        engine, nyquist_guard, interpolation, jobs, backend, dtype,
+        loop, loop_tolerance
+):
+    create(
+        wave_component, out, samplerate, duration, fourierterms,
+        engine=engine, nyquist_guard=nyquist_guard,
+        interpolation=interpolation, workers=jobs or None,
+        backend=backend, dtype=dtype,
+        loop=loop, loop_tolerance=loop_tolerance
+    )
 
 
 if __name__ == "__main__":
@@ -3,10 +3,13 @@ from scipy import linalg
 import numpy as np
 from pathlib import Path
 from os import getenv
-from .utils.helpers import load_cache, builder_cache_key, cache_it
+from .utils.helpers import builder_cache_key, cache_it
+from .utils.cache import configured_cache
+from .utils.profiling import span
 from .utils.signal import write_stereo
-from .signal_builder import SignalBuilder
+from .signal_builder import SignalBuilder, RenderedSignal
 from .settings.logging_settings import get_logger
+from .settings.config import BUILDER_CACHE_DIR
 
 
 logger = get_logger(__name__)
@@ -17,7 +20,7 @@ COLORSPACE = {
     "RGBA": {"range": (0, 255), "channels": ("R", "G", "B", "A")},
     "CMYK": {"range": (0, 100), "channels": ("C", "M", "Y", "K")},
 }
-BUILDER_CACHE = load_cache()
+BUILDER_CACHE = configured_cache(BUILDER_CACHE_DIR)
 
 
 def default_amp_calculator(
@@ -41,17 +44,15 @@ class Channel:
         self.data = np.asarray(data)
         self.name = name
         self.resolution = resolution
-        self._svd()
-        logger.debug(
-            '<{} band> Calculating eigenvalues and eigenvectors for U...'
-            .format(self.name)
-        )
-        self.eigUvalues, self.eigUvectors = linalg.eig(self.U)
-        logger.debug(
-            '<{} band> Calculating eigenvalues and eigenvectors for V...'
-            .format(self.name)
-        )
-        self.eigVvalues, self.eigVvectors = linalg.eig(self.V)
+        with span("svd"):
+            self._svd()
+        with span("eig"):
+            logger.debug(
+                '<%s band> Calculating eigenvalues and eigenvectors for U...', self.name)
+            self.eigUvalues, self.eigUvectors = linalg.eig(self.U)
+            logger.debug(
+                '<%s band> Calculating eigenvalues and eigenvectors for V...', self.name)
+            self.eigVvalues, self.eigVvectors = linalg.eig(self.V)
         self.intervals = self._intervals()
         self.amp_calc = amplitude_calculator
 
@@ -87,25 +88,36 @@ class Channel:
         waves = kw.get("waves", ["sine" for _ in range(self.resolution)])
         samplerate = kw.get("samplerate", 48000)
         duration = kw.get("duration", 1)
-        s = self._cached_builder(
+        scaled_signal = self._cached_signal(
             frequencies,
             amplitudes,
             waves,
             phases,
             n_max,
-            duration,
-            samplerate
+            samplerate,
+            duration
+        )
+        return RenderedSignal(
+            scaled_signal,
+            frequencies,
+            amplitudes,
+            waves,
+            phases,
+            n_max=n_max,
+            duration=duration,
+            samplerate=samplerate
         )
-        return s
 
     @staticmethod
-    @cache_it(BUILDER_CACHE, builder_cache_key)
-    def _cached_builder(
+    @cache_it(BUILDER_CACHE, builder_cache_key, path=None)
+    def _cached_signal(
             freqs, amps, waves, phases, n_max, samplerate, duration):
+        # only the normalized array is cached: it is stored as .npy and
+        # read back memory mapped, the parameters are in the key
         return SignalBuilder(
             freqs, amps, waves, phases,
-            n_max, samplerate, duration
-        )
+            n_max=n_max, duration=duration, samplerate=samplerate
+        ).scaled_signal
 
 
 class SoundImage:
@@ -149,16 +161,17 @@ class SoundImage:
                 path = path + ".wav"
             outpath = Path(path)
         outpath.parent.mkdir(parents=True, exist_ok=True)
-        left_builder = self.channels.get(left_band).audio_signal(fudge, **kw)
+        left_signal = self.channels.get(left_band).audio_signal(fudge, **kw)
         logger.info("saving audio to {}".format(str(outpath)))
         if right_band is None:
-            left_builder.export(str(outpath), bit_depth=bit_depth)
+            left_signal.export(str(outpath), bit_depth=bit_depth)
         else:
-            right_builder = self.channels.get(right_band).audio_signal(fudge, **kw)
-            assert left_builder.samplerate == right_builder.samplerate
-            write_stereo(
-                left_builder.scaled_signal, right_builder.scaled_signal,
-                str(outpath),
-                bit_depth=bit_depth,
-                samplerate=left_builder.samplerate
-            )
+            right_signal = self.channels.get(right_band).audio_signal(fudge, **kw)
+            assert left_signal.samplerate == right_signal.samplerate
+            with span("export"):
+                write_stereo(
+                    left_signal.scaled_signal, right_signal.scaled_signal,
+                    str(outpath),
+                    bit_depth=bit_depth,
+                    samplerate=left_signal.samplerate
+                )
@@ -8,6 +8,7 @@ import soundfile as sf
 from soundfactory.settings.input_validators import ExistentWav
 from soundfactory.settings.logging_settings import playlog
 from soundfactory.utils.helpers import progress_time
+from soundfactory.utils.profiling import span
 from soundfactory.constants import MAX_16_BIT_VALUE, BYTE_PER_16_BIT
 
 
@@ -16,7 +17,8 @@ def play(path):
         playlog.info("Loading audio from {}".format(path))
         channels, samplerate = f.channels, f.samplerate
         total_seconds = len(f) / samplerate
-        audio = f.read(dtype="float32")
+        with span("load"):
+            audio = f.read(dtype="float32")
         playlog.info(
             "Loaded {t:.2f} seconds from {c} audio".format(
                 t=total_seconds,
@@ -1,5 +1,35 @@
+import os
 from pathlib import Path
 
 this_folder = Path(__file__).resolve().parent
 
 BUILDER_CACHE_PATH = str(this_folder / "builder_cache.pickle")
+# One file per entry, see utils.cache.CacheStore
+BUILDER_CACHE_DIR = str(this_folder / "builder_cache")
+# Rendered components of SignalBuilder, next to the package modules
+SIGNAL_CACHE_DIR = str(this_folder.parent / "signal_builder_cache")
+# Unit-amplitude periods of the wave shapes, read by every rendering path
+WAVETABLE_CACHE_DIR = str(this_folder.parent / "wavetable_cache")
+# Fastest synthesis backend found on each machine by the "auto" backend
+BACKEND_CHOICE_PATH = str(this_folder / "backend.json")
+# Name of a synthesis backend (or "auto") used when none is given
+BACKEND_ENV_VAR = "SOUNDFACTORY_BACKEND"
+
+# Eviction policy and byte budgets of the in-memory and on-disk layers
+# of each cache (the components and the SoundImage signals), and the
+# seconds an entry lives with the "ttl" policy
+CACHE_POLICIES = ("lru", "lfu", "ttl")
+CACHE_POLICY = os.getenv("SOUNDFACTORY_CACHE_POLICY", "lru")
+CACHE_MEMORY_BYTES = int(os.getenv("SOUNDFACTORY_CACHE_MEMORY_BYTES", 512 * 2 ** 20))
+CACHE_DISK_BYTES = int(os.getenv("SOUNDFACTORY_CACHE_DISK_BYTES", 4 * 2 ** 30))
+CACHE_TTL = float(os.getenv("SOUNDFACTORY_CACHE_TTL", 30 * 24 * 3600))
+# "jsonl" keeps the index of the on-disk caches in an append-only file,
+# "sqlite" in a database shared with the usage counts of all the processes
+CACHE_INDEXES = ("jsonl", "sqlite")
+CACHE_INDEX = os.getenv("SOUNDFACTORY_CACHE_INDEX", "jsonl")
+# Grid steps the numbers in the cache keys are rounded to: frequencies in
+# Hz, phases in degrees, any other number. Coarser grids trade exactness
+# for more hits, the first component rendered on a grid point is reused
+CACHE_FREQ_QUANTUM = float(os.getenv("SOUNDFACTORY_CACHE_FREQ_QUANTUM", 1e-6))
+CACHE_PHASE_QUANTUM = float(os.getenv("SOUNDFACTORY_CACHE_PHASE_QUANTUM", 1e-6))
+CACHE_VALUE_QUANTUM = float(os.getenv("SOUNDFACTORY_CACHE_VALUE_QUANTUM", 1e-9))
@@ -1,6 +1,6 @@
 import os
 import click
-from soundfactory.settings.signal import B_N_COEFF_MAP
+from soundfactory.settings.signal import WAVE_SHAPES
 
 DEFAULT_PHASE = 0
 DEFAULT_WAVE_TYPE = "sine"
@@ -108,7 +108,7 @@ class WaveComponent(click.ParamType):
             except ValueError:
                 if not self.is_valid_waveshape(value[-1]):
                     self.fail('available waveforms are: {}'.format(
-                        sorted(B_N_COEFF_MAP.keys())),
+                        list(WAVE_SHAPES)),
                         param, ctx)
         
         if len(value) == 4:
@@ -121,9 +121,9 @@ class WaveComponent(click.ParamType):
             if not self.is_valid_waveshape(value[-1]):
                 self.fail(
                     'available waveforms are: {}'.format(
-                        sorted(B_N_COEFF_MAP.keys())),
+                        list(WAVE_SHAPES)),
                     param, ctx)
 
     @staticmethod
     def is_valid_waveshape(shape):
-        return shape in B_N_COEFF_MAP
+        return shape in WAVE_SHAPES
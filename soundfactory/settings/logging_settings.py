@@ -30,3 +30,9 @@ signal_log.setLevel(logging.DEBUG)
 
 helperlog = get_logger(name="helper")
 helperlog.setLevel(logging.INFO)
+
+cachelog = get_logger(name="cache")
+cachelog.setLevel(logging.INFO)
+
+benchlog = get_logger(name="bench")
+benchlog.setLevel(logging.INFO)
@@ -1,14 +1,50 @@
-import numpy as np
+# Shapes of B_N_COEFF_MAP, known without importing numpy
+WAVE_SHAPES = ("sawtooth", "sine", "square", "triangle")
 
-alternate_minus_odd = lambda x: (-1.0) ** ((x.astype(complex) - 1) / 2)
 
-real_part_or_zero_otherwise = lambda x: np.where(np.isreal(x), x, 0).real
+def _b_n_coeff_map():
+    import numpy as np
 
+    alternate_minus_odd = lambda x: (-1.0) ** ((x.astype(complex) - 1) / 2)
 
-B_N_COEFF_MAP = {
-    "sine": lambda x: np.where(x == 1, 1.0, 0),
-    "sawtooth": lambda x: -2.0 / (np.pi * x),
-    "square": lambda x: np.where(x % 2 == 1, 4.0 / (np.pi * x), 0),
-    "triangle": lambda x: real_part_or_zero_otherwise(alternate_minus_odd(x))
-    * (8.0 / (np.pi * x) ** 2),
-}
+    real_part_or_zero_otherwise = lambda x: np.where(np.isreal(x), x, 0).real
+
+    return {
+        "sine": lambda x: np.where(x == 1, 1.0, 0),
+        "sawtooth": lambda x: -2.0 / (np.pi * x),
+        "square": lambda x: np.where(x % 2 == 1, 4.0 / (np.pi * x), 0),
+        "triangle": lambda x: real_part_or_zero_otherwise(alternate_minus_odd(x))
+        * (8.0 / (np.pi * x) ** 2),
+    }
+
+
+def __getattr__(name):
+    # B_N_COEFF_MAP is built on first use: the CLI reads the settings
+    # below to build its options, without importing numpy
+    if name == "B_N_COEFF_MAP":
+        globals()[name] = _b_n_coeff_map()
+        return globals()[name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+# "series" sums the Fourier series of each component in the time domain,
+# "ifft" places every harmonic in its frequency bin and renders the whole
+# mix with a single real inverse FFT
+SYNTHESIS_ENGINES = ("series", "ifft")
+
+# Interpolation between wavetable points, as polynomial order
+INTERPOLATION_ORDERS = {"nearest": 0, "linear": 1, "cubic": 3}
+
+# Largest ratio between an interpolated value and the largest table value:
+# the cubic (Catmull-Rom) weights add up to 1.25 in absolute value halfway
+# between two points, the other orders never leave the table range
+INTERPOLATION_OVERSHOOT = {"nearest": 1., "linear": 1., "cubic": 1.25}
+
+# Kernels rendering the series: the compiled extension, the numba jitted
+# twins, plain numpy, or the ifft engine (which needs no per-sample kernel)
+SYNTHESIS_BACKENDS = ("cython", "numba", "numpy", "ifft")
+
+# Sample formats of the rendered signal. Phases and wavetables always stay
+# in double precision: a float32 render differs from the float64 one by
+# less than FLOAT32_TOLERANCE (half a 16 bit step) once peak-normalized
+SYNTHESIS_DTYPES = ("float64", "float32")
+FLOAT32_TOLERANCE = 2 ** -16
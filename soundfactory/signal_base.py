@@ -1,9 +1,109 @@
+from collections.abc import Mapping, MutableMapping
+
+import numpy as np
+
 from soundfactory.utils.signal import (get_envelope,
-                                       load_audio)
-from soundfactory.utils.helpers import spectrum
+                                       load_audio,
+                                       to_float32)
+from soundfactory.utils.helpers import spectrum, welch_spectrum
+from soundfactory.constants import DEFAULT_BLOCK_SIZE
+from soundfactory.utils.profiling import span, allocated
 from soundfactory.settings.logging_settings import signal_log
 
 
+class Channels(MutableMapping):
+    """
+    The samples of each channel of a signal, as float32 arrays. Channels
+    added with set_raw keep the samples as stored in a memory mapped
+    file, and are only scaled to float32 when first accessed
+    """
+
+    def __init__(self):
+        self._arrays = dict()
+        self._raw = set()
+
+    def set_raw(self, name, samples):
+        self._arrays[name] = samples
+        self._raw.add(name)
+
+    def samples(self, name):
+        """ The samples of name as stored: scale them with to_float32 """
+        return self._arrays[name]
+
+    def __getitem__(self, name):
+        if name in self._raw:
+            self._arrays[name] = to_float32(self._arrays[name])
+            self._raw.discard(name)
+        return self._arrays[name]
+
+    def __setitem__(self, name, samples):
+        self._arrays[name] = samples
+        self._raw.discard(name)
+
+    def __delitem__(self, name):
+        del self._arrays[name]
+        self._raw.discard(name)
+
+    def __iter__(self):
+        return iter(self._arrays)
+
+    def __len__(self):
+        return len(self._arrays)
+
+
+class LazyAnalysis(Mapping):
+    """
+    The analysis of each channel of a signal, under the channel name
+    plus suffix: computed on first access, then kept as long as the
+    channel holds the same array. With raw, the analysis takes the
+    samples as stored (see Channels.samples) instead of float32 ones
+    """
+
+    def __init__(self, channels, suffix, analysis, name, enabled=True, raw=False):
+        self.channels = channels
+        self.suffix = suffix
+        self.analysis = analysis
+        self.name = name
+        self.enabled = enabled
+        self.raw = raw
+        self._results = dict()
+
+    def _channel(self, key):
+        if not self.enabled or not key.endswith(self.suffix):
+            raise KeyError(key)
+        return key[:-len(self.suffix)]
+
+    def __getitem__(self, key):
+        channel = self._channel(key)
+        sig = self.channels.samples(channel) if self.raw else self.channels[channel]
+        analysed, result = self._results.get(key, (None, None))
+        if analysed is not sig:
+            signal_log.info("Calculating %s", key)
+            with span(self.name):
+                result = self.analysis(sig)
+            self._results[key] = (sig, result)
+        return result
+
+    def __iter__(self):
+        if not self.enabled:
+            return iter(())
+        return (ch + self.suffix for ch in self.channels)
+
+    def __len__(self):
+        return len(self.channels) if self.enabled else 0
+
+    def calculated(self):
+        """ Keys analysed so far """
+        return [key for key in self._results if key in self]
+
+    def invalidate(self, key=None):
+        """ Forget the analysis of key, or of all the channels """
+        if key is None:
+            self._results.clear()
+        else:
+            self._results.pop(key, None)
+
+
 class Signal:
     CH = 'ch'
     CH1 = 'ch1'
@@ -15,58 +115,81 @@ class Signal:
     CHANNELS = dict()
     SPECTRA = dict()
 
-    def __init__(self, input_file, with_envelope=False):
+    def __init__(self, input_file, with_envelope=False,
+                 start=None, end=None, mmap=False, welch=None):
         self.MONO = False
         self.CALCULATE_ENVELOPE = with_envelope
-        self.ENVELOPES = dict()
-        self.CHANNELS = dict()
-        self.SPECTRA = dict()
+        # None for a single FFT of each channel, else the arguments of
+        # welch_spectrum (and block_size) for an averaged one
+        self.welch = welch
+        self.CHANNELS = Channels()
+        # Envelopes and spectra are calculated when first accessed. The
+        # averaged spectra read the samples as stored, a block at a time
+        self.ENVELOPES = LazyAnalysis(
+            self.CHANNELS, self.ENVELOPE_SUFFIX, get_envelope, "envelope",
+            enabled=with_envelope)
+        self.SPECTRA = LazyAnalysis(
+            self.CHANNELS, self.FFT_SUFFIX, self._spectrum, "fft",
+            raw=welch is not None)
         self.signal = None
         self.sampling_rate = None
         self.duration = 0
         self.samples = 0
-        self._load_audio(input_file)
-        self._calculate_envelope()
-        self._calculate_fft()
+        # time of the first sample loaded
+        self.offset = 0.
+        self._load_audio(input_file, start=start, end=end, mmap=mmap)
 
     @staticmethod
     def _is_mono(signal_arr):
         return len(signal_arr.shape) == 1
 
-    def _load_audio(self, input_file):
-        self.signal, self.sampling_rate = load_audio(input_file)
+    def _load_audio(self, input_file, start=None, end=None, mmap=False):
+        # memory mapped samples stay as stored, until a channel is used
+        with span("load"):
+            self.signal, self.sampling_rate = load_audio(
+                input_file, start=start, end=end, mmap=mmap, raw=True)
+        if not isinstance(self.signal, np.memmap):
+            allocated("audio", self.signal)
+        if start is not None:
+            self.offset = round(max(start, 0.) * self.sampling_rate) / self.sampling_rate
 
         if self._is_mono(self.signal):
             self.MONO = True
-            self.CHANNELS.update({self.CH1: self.signal})
+            self.CHANNELS.set_raw(self.CH1, self.signal)
         else:
-            self.CHANNELS.update(
-                {self.CH + str(i + 1): self.signal[:, i]
-                 for i in range(len(self.signal.shape))
-                 }
-            )
+            for i in range(len(self.signal.shape)):
+                self.CHANNELS.set_raw(self.CH + str(i + 1), self.signal[:, i])
 
-        self.samples = self.CHANNELS[self.CH1].shape[0]
+        self.samples = self.signal.shape[0]
 
         self.duration = self.samples / self.sampling_rate
         signal_log.info("Loaded {t:.2f} seconds from {c} audio".format(
             t=self.duration, c="mono" if self.MONO else "stereo"
-        ))
-
-    def _calculate_envelope(self):
-        if self.CALCULATE_ENVELOPE:
-            signal_log.info("Calculating envelope%s"
-                            % ('' if self.MONO else 's'))
-            # Volume envelopes
-            self.ENVELOPES.update(
-                {ch + self.ENVELOPE_SUFFIX: get_envelope(sig)
-                 for ch, sig in self.CHANNELS.items()
-                 }
-            )
+        ) + (" at {:.2f} seconds".format(self.offset) if self.offset else ""))
 
-    def _calculate_fft(self):
-        for ch, sig in self.CHANNELS.items():
-            res = dict()
+    def _spectrum(self, sig):
+        res = dict()
+        if self.welch is None:
             res[self.FREQUENCIES], res[self.POWERS] = \
                 spectrum(sig, self.sampling_rate)
-            self.SPECTRA.update({ch + self.FFT_SUFFIX: res})
+        else:
+            options = dict(self.welch)
+            block_size = options.pop("block_size", DEFAULT_BLOCK_SIZE)
+            # a block at a time: a memory mapped channel is read, and
+            # scaled, as it goes
+            blocks = (
+                to_float32(sig[i:i + block_size])
+                for i in range(0, len(sig), block_size)
+            )
+            res[self.FREQUENCIES], res[self.POWERS] = \
+                welch_spectrum(blocks, self.sampling_rate, **options)
+        return res
+
+    def invalidate(self, channel=None):
+        """
+        Forget the envelopes and spectra of channel, or of all the
+        channels, after changing their samples in place. Replacing an
+        array in CHANNELS is noticed without it
+        """
+        for analysis in (self.ENVELOPES, self.SPECTRA):
+            analysis.invalidate(None if channel is None else channel + analysis.suffix)
@@ -1,16 +1,38 @@
 import numbers
 import numpy as np
 from pathlib import Path
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 
-from .constants import DEFAULT_SAMPLERATE
-from .settings.signal import B_N_COEFF_MAP
-from .utils.signal import write
+from .constants import (
+    DEFAULT_SAMPLERATE, DEFAULT_TABLE_SIZE, DEFAULT_BLOCK_SIZE,
+    DEFAULT_LOOP_TOLERANCE
+)
+from .settings.signal import (
+    B_N_COEFF_MAP, SYNTHESIS_ENGINES, SYNTHESIS_BACKENDS, SYNTHESIS_DTYPES,
+    INTERPOLATION_ORDERS, INTERPOLATION_OVERSHOOT
+)
+from .utils.signal import (
+    write, write_blocks, write_loop_points, build_real_signal, loop_length
+)
+from .settings.config import SIGNAL_CACHE_DIR, WAVETABLE_CACHE_DIR
 from .settings.logging_settings import createlog
-from .utils.helpers import load_cache, single_component_cache_key, cache_it
-from soundfactory.cyutils import builder_utils as cy_builder_utils
+from .utils.helpers import (
+    single_component_cache_key, wavetable_cache_key, cache_it
+)
+from .utils.cache import configured_cache
+from .utils.profiling import span, allocated
+from .utils.backends import (
+    AUTO, BackendNotAvailable, load_kernels, resolve_backend
+)
 
-CACHE_PATH = str(Path(__file__).resolve().parent / 'signal_builder.pickle')
-CACHE = load_cache(path=CACHE_PATH)
+CACHE_PATH = SIGNAL_CACHE_DIR
+CACHE = configured_cache(CACHE_PATH)
+# Unit-amplitude periods, shared by all the builders and saved on disk:
+# they do not depend on frequency, amplitude or phase, so every path
+# (rendered, streamed or looped) reuses them. Read in memory, as the
+# kernels take writable arrays
+WAVETABLES = configured_cache(WAVETABLE_CACHE_DIR, mmap=False)
 
 
 class SignalBuilderError(Exception):
@@ -46,8 +68,65 @@ class ProvidedInputError(SignalBuilderError):
         return self.message
 
 
+class RenderedSignal:
+    """
+    Peak-normalized render of a SignalBuilder, with the parameters it
+    was built from. It only holds scaled_signal, which can be a
+    read-only memory map of a cached array: time_space is computed on
+    access and nothing else is kept
+    """
+
+    def __init__(
+        self,
+        scaled_signal,
+        frequencies,
+        amplitudes,
+        wave_types,
+        phases=None,
+        n_max=1000,
+        duration=1.0,
+        samplerate=DEFAULT_SAMPLERATE,
+    ):
+        self.scaled_signal = scaled_signal
+        self.frequencies = frequencies
+        self.amplitudes = amplitudes
+        self.wave_types = wave_types
+        self.phases = phases
+        self.n_max = n_max
+        self.duration = duration
+        self.samplerate = samplerate
+        self.n_samples = scaled_signal.shape[0]
+
+    @property
+    def time_space(self):
+        return np.linspace(
+            0.0, self.duration, self.n_samples, endpoint=False, dtype=np.float64
+        )
+
+    def export(self, path, bit_depth=16):
+        with span("export"):
+            write(self.scaled_signal, path, samplerate=self.samplerate, bit_depth=bit_depth)
+
+
 class SignalBuilder:
-    """ Create a Signal from Fourier Series """
+    """
+    Create a Signal from Fourier Series
+
+    Nothing is rendered until signal or scaled_signal are accessed:
+    iter_blocks and export can render and write the signal block
+    by block, without ever holding it whole in memory.
+
+    The kernels come from the given backend, or the one named by the
+    SOUNDFACTORY_BACKEND environment variable: "auto" uses the fastest
+    one on this machine, found with a one-off benchmark.
+
+    With dtype="float32" the components are rendered, mixed, normalized
+    and exported in single precision, within FLOAT32_TOLERANCE of the
+    float64 render.
+
+    With loop=True, a signal repeating within the duration is synthesized
+    for one common period only, then tiled: see loop_length
+    """
 
     def __init__(
         self,
@@ -58,23 +137,104 @@ class SignalBuilder:
         n_max=1000,
         duration=1.0,
         samplerate=DEFAULT_SAMPLERATE,
+        engine="series",
+        nyquist_guard=None,
+        table_size=DEFAULT_TABLE_SIZE,
+        interpolation="linear",
+        workers=1,
+        backend=None,
+        dtype="float64",
+        loop=False,
+        loop_tolerance=DEFAULT_LOOP_TOLERANCE,
     ):
         self.frequencies = frequencies
         self.amplitudes = amplitudes
         self.phases = None
         self.set_phases(phases)
         self.wave_types = wave_types
+        self.engine = engine
+        self.nyquist_guard = nyquist_guard
+        self.table_size = table_size
+        self.interpolation = interpolation
+        self.workers = workers
+        self.backend = backend
+        self.dtype = dtype
+        self.loop = loop
+        self.loop_tolerance = loop_tolerance
         self.check_input()
+        self.dtype = np.dtype(dtype)
+        try:
+            self.backend = resolve_backend(backend)
+        except BackendNotAvailable as e:
+            raise ProvidedInputError(str(e))
+        if self.backend == "ifft":
+            self.engine = "ifft"
+        else:
+            # fail early if the kernels cannot be imported
+            self.kernels
         self.n_terms = np.arange(1, n_max + 1, dtype=np.int64)
         self.duration = duration
         self.samplerate = samplerate
         self.n_samples = int(self.duration * self.samplerate)
-        self.time_space = np.linspace(
-            0.0, self.duration, self.n_samples, endpoint=False, dtype=np.float64
-        )
         self.a0 = 0
-        self.signal = self.build_signal()
-        self.scaled_signal = self.signal / np.max(np.abs(self.signal), axis=0)
+        self._time_space = None
+        self._signal = None
+        self._scaled_signal = None
+        self._oscillator_list = None
+        self._loop_length = None
+        self._loop_period = None
+
+    @property
+    def time_space(self):
+        if self._time_space is None:
+            # always double: float32 times lose whole samples after minutes
+            self._time_space = np.linspace(
+                0.0, self.duration, self.n_samples, endpoint=False, dtype=np.float64
+            )
+        return self._time_space
+
+    @property
+    def signal(self):
+        if self._signal is None:
+            self._signal = self.build_signal()
+        return self._signal
+
+    @property
+    def scaled_signal(self):
+        if self._scaled_signal is None:
+            self._scaled_signal = self.signal / np.max(np.abs(self.signal), axis=0)
+        return self._scaled_signal
+
+    @property
+    def kernels(self):
+        # looked up by name, so that builders can still be pickled.
+        # The ifft backend renders with the ifft engine and has none
+        try:
+            return load_kernels(self.backend)
+        except BackendNotAvailable as e:
+            raise ProvidedInputError(str(e))
+
+    @property
+    def loop_length(self):
+        """
+        Samples after which all the components are back to their
+        starting phase, within loop_tolerance cycles. None when not in
+        loop mode or when the signal does not repeat within the duration
+        """
+        if not self.loop or self.engine == "ifft":
+            return None
+        if self._loop_length is None:
+            # 0 once searched without finding a loop
+            self._loop_length = loop_length(
+                [round(freq, 2) for freq in self.frequencies],
+                self.samplerate, self.n_samples - 1, tolerance=self.loop_tolerance
+            ) or 0
+        return self._loop_length or None
+
+    def render(self):
+        """ Render the whole signal in memory """
+        self.scaled_signal
+        return self
 
     def get_time_space(self):
         return self.time_space
@@ -90,6 +250,39 @@ class SignalBuilder:
             )
         if any(not isinstance(x, numbers.Real) for l in [f, a, p] for x in l):
             raise ProvidedInputError("Use only real numbers (floats or ints)")
+        if self.engine not in SYNTHESIS_ENGINES:
+            raise ProvidedInputError(
+                "{} engine not supported. It must be one of {}".format(
+                    self.engine, SYNTHESIS_ENGINES)
+            )
+        guard = self.nyquist_guard
+        if guard is not None and not 0 <= guard < 1:
+            raise ProvidedInputError(
+                "nyquist_guard must be None or a fraction in [0, 1)"
+            )
+        if self.interpolation not in INTERPOLATION_ORDERS:
+            raise ProvidedInputError(
+                "{} interpolation not supported. It must be one of {}".format(
+                    self.interpolation, tuple(INTERPOLATION_ORDERS))
+            )
+        if int(self.table_size) < 4:
+            raise ProvidedInputError("table_size must be at least 4 points")
+        if self.workers is not None and int(self.workers) < 1:
+            raise ProvidedInputError("workers must be None or a positive integer")
+        try:
+            dtype = np.dtype(self.dtype).name
+        except TypeError:
+            dtype = self.dtype
+        if dtype not in SYNTHESIS_DTYPES:
+            raise ProvidedInputError(
+                "{} dtype not supported. It must be one of {}".format(
+                    self.dtype, SYNTHESIS_DTYPES)
+            )
+        if self.backend not in SYNTHESIS_BACKENDS + (AUTO, None):
+            raise ProvidedInputError(
+                "{} backend not supported. It must be one of {}".format(
+                    self.backend, SYNTHESIS_BACKENDS + (AUTO,))
+            )
 
     def set_phases(self, phases):
         if phases is None:
@@ -97,35 +290,279 @@ class SignalBuilder:
         else:
             self.phases = phases
 
-    @cache_it(CACHE, single_component_cache_key, path=CACHE_PATH)
-    def _compute_component(self, _freq, _amp, _phase, _shape, n_max, samplerate, duration):
-        # n_max and samplerate are used in the specified key_encoder to create the cache key
+    def _series_terms(self, _freq, _shape):
+        """
+        Harmonic orders and coefficients of the terms worth summing:
+        the ones with a zero coefficient are skipped and, when a
+        nyquist_guard is given, so are the ones aliasing above
+        (1 - nyquist_guard) * samplerate / 2
+        """
         coefficients = B_N_COEFF_MAP[_shape]
         coefficients = np.asarray(coefficients(self.n_terms), dtype=np.float64)
-        upsampled = cy_builder_utils.upsample_component(
-            _amp, _phase, duration, self.time_space, coefficients, self.n_terms
-        )
-        component = cy_builder_utils.single_component(
-            _freq, self.duration, upsampled, self.n_samples
+        keep = coefficients != 0
+        if self.nyquist_guard is not None:
+            cutoff = (1 - self.nyquist_guard) * self.samplerate / 2
+            keep &= self.n_terms * _freq < cutoff
+        return self.n_terms[keep], coefficients[keep]
+
+    @cache_it(WAVETABLES, wavetable_cache_key, path=None)
+    def _wavetable(self, _shape, n_max, table_size):
+        """
+        One period of the unit-amplitude series sampled on table_size points.
+        It does not depend on the frequency: n_max is the highest harmonic
+        kept for the component, amplitude and phase are applied when the
+        table is read
+        """
+        terms = np.arange(1, n_max + 1, dtype=np.int64)
+        coefficients = B_N_COEFF_MAP[_shape]
+        coefficients = np.asarray(coefficients(terms), dtype=np.float64)
+        nonzero = coefficients != 0
+        times = np.linspace(0.0, 1.0, table_size, endpoint=False, dtype=np.float64)
+        return self.kernels.fourier_period(
+            1., 0., 1., times, coefficients[nonzero], terms[nonzero]
         )
-        return component
+
+    def _wavetable_args(self, terms, _shape):
+        highest_term = int(terms[-1]) if terms.shape[0] else 0
+        return _shape, highest_term, int(self.table_size)
+
+    def _component_table(self, _freq, _shape):
+        terms, _ = self._series_terms(_freq, _shape)
+        return self._wavetable(*self._wavetable_args(terms, _shape))
+
+    @cache_it(CACHE, single_component_cache_key, path=None)
+    def _compute_component(
+            self, _freq, _phase, _shape, n_max, samplerate, duration,
+            nyquist_guard, table_size, interpolation, dtype
+    ):
+        # n_max, samplerate, nyquist_guard, table_size, interpolation and
+        # dtype are used in the specified key_encoder to create the cache key.
+        # The component has unit amplitude, so that any amplitude reuses it
+        table = self._component_table(_freq, _shape)
+        with span("synth.component"):
+            # a phase shift of every term n * phase moves the whole period
+            return allocated("component", self.kernels.phase_accumulator(
+                _freq, self.samplerate, table, self.n_samples,
+                phase=_phase / 360., order=INTERPOLATION_ORDERS[interpolation],
+                dtype=dtype
+            ))
+
+    def _harmonics(self, _freq, _amp, _phase, _shape):
+        # Frequencies, amplitudes and phases of the terms of the series
+        terms, coefficients = self._series_terms(_freq, _shape)
+        return _freq * terms, _amp * coefficients, terms * np.radians(_phase)
+
+    def _build_signal_ifft(self):
+        freqs, amps, phases = list(), list(), list()
+        for freq, amp, ph, shape in zip(
+            self.frequencies, self.amplitudes, self.phases, self.wave_types
+        ):
+            createlog.info(
+                "Adding spectrum of %s wave of %s hz frequency with amplitude %s",
+                shape, round(freq, 2), round(amp, 2)
+            )
+            f, a, p = self._harmonics(float(freq), float(amp), float(ph), shape)
+            freqs.append(f)
+            amps.append(a)
+            phases.append(p)
+        freqs, amps, phases = (np.concatenate(x) for x in (freqs, amps, phases))
+        period = self.n_samples / self.samplerate
+        bins = freqs * period
+        if not np.allclose(bins, np.round(bins)):
+            createlog.warning(
+                "ifft engine: frequencies are rounded to multiples "
+                "of {} hz".format(round(1 / period, 4))
+            )
+        # a sin(x + p) = a cos(x + p - pi/2), and build_fft
+        # expects half of the amplitude on each side of the spectrum
+        with span("synth.ifft"):
+            signal = build_real_signal(
+                freqs, amps / 2, phases - np.pi / 2,
+                period=period, samplerate=self.samplerate
+            )
+        return allocated("signal", signal.astype(self.dtype, copy=False))
+
+    def _executor(self):
+        # Components are rendered on self.workers threads (all the cores
+        # if None), the kernels release the GIL. Results are always summed
+        # in input order, so the output does not depend on scheduling.
+        # With a single worker they are rendered inline, with no pool.
+        # The kernels do not catch interrupts: a Ctrl-C is raised in the
+        # calling thread between two components or blocks
+        if self.workers == 1:
+            return nullcontext()
+        return ThreadPoolExecutor(max_workers=self.workers)
+
+    @staticmethod
+    def _map(executor, function, items):
+        # executor is None when running inline
+        return (executor.map if executor else map)(function, items)
 
     def build_signal(self):
-        signal = np.zeros(self.n_samples, dtype="float64")
+        if self.engine == "ifft":
+            return self._build_signal_ifft()
+        if self.loop_length:
+            return np.resize(self._period(), self.n_samples)
+        components = list()
         for freq, amp, ph, shape in zip(
             self.frequencies, self.amplitudes, self.phases, self.wave_types
         ):
             freq = round(freq, 2)
             createlog.info(
-                "Adding components from {s} wave of {f} hz frequency with amplitude {a}".format(
-                    s=shape, f=freq, a=round(amp, 2)
-                )
+                "Adding components from %s wave of %s hz frequency with amplitude %s",
+                shape, freq, round(amp, 2)
             )
-            signal += self._compute_component(
-                float(freq), float(amp), float(ph), shape, self.n_terms.shape[0], self.samplerate, float(self.duration)
+            components.append((float(freq), float(amp), float(ph), shape))
+
+        def compute(component):
+            freq, _, ph, shape = component
+            return self._compute_component(
+                freq, ph, shape,
+                self.n_terms.shape[0], self.samplerate, float(self.duration),
+                self.nyquist_guard, self.table_size, self.interpolation,
+                self.dtype.name
             )
 
+        signal = allocated("signal", np.zeros(self.n_samples, dtype=self.dtype))
+        with span("synth"), self._executor() as executor:
+            # fill the shared wavetables first
+            self._oscillators(executor)
+            for (_, amp, _, _), component in zip(
+                    components, self._map(executor, compute, components)):
+                signal += amp * component
+
         return signal
 
-    def export(self, path, bit_depth=16):
-        write(self.scaled_signal, path, samplerate=self.samplerate, bit_depth=bit_depth)
+    def _oscillators(self, executor=None):
+        # wavetable, amplitude, frequency and starting phase (in cycles)
+        # of each component, as used by build_signal
+        if self._oscillator_list is not None:
+            return self._oscillator_list
+        components = [
+            (float(round(freq, 2)), float(amp), float(ph) / 360., shape)
+            for freq, amp, ph, shape in zip(
+                self.frequencies, self.amplitudes, self.phases, self.wave_types)
+        ]
+        keys = list()
+        for freq, _, _, shape in components:
+            terms, _ = self._series_terms(freq, shape)
+            createlog.info(
+                "%s wave of %s hz: summing %s of %s Fourier terms",
+                shape, freq, terms.shape[0], self.n_terms.shape[0]
+            )
+            keys.append(self._wavetable_args(terms, shape))
+        # each distinct table is computed once, even when running in threads
+        unique_keys = list(dict.fromkeys(keys))
+        with span("synth.wavetables"):
+            tables = dict(zip(
+                unique_keys,
+                self._map(
+                    executor, lambda key: self._wavetable(*key), unique_keys)
+            ))
+        self._oscillator_list = [
+            (tables[key], amp, freq, phase)
+            for key, (freq, amp, phase, _) in zip(keys, components)
+        ]
+        return self._oscillator_list
+
+    def _render_block(self, executor, start, samples):
+        # samples from start of the mix of the oscillators
+        order = INTERPOLATION_ORDERS[self.interpolation]
+        kernels = self.kernels
+
+        def render(oscillator):
+            table, amp, freq, phase = oscillator
+            return amp * kernels.phase_accumulator(
+                freq, self.samplerate, table, samples,
+                phase=phase, start=start, order=order, dtype=self.dtype
+            )
+
+        oscillators = self._oscillators(executor)
+        with span("synth.block"):
+            block = allocated("block", np.zeros(samples, dtype=self.dtype))
+            for component in self._map(executor, render, oscillators):
+                block += component
+        return block
+
+    def _period(self):
+        # the first loop_length samples, repeated over the duration
+        if self._loop_period is None:
+            createlog.info("Rendering a loop of {} samples".format(self.loop_length))
+            with self._executor() as executor:
+                self._loop_period = self._render_block(executor, 0, self.loop_length)
+        return self._loop_period
+
+    def iter_blocks(self, block_size=DEFAULT_BLOCK_SIZE):
+        """
+        Yield the signal in consecutive blocks of block_size samples
+        (the last one can be shorter). Unless the signal has already been
+        rendered, each block is synthesized on its own. The ifft engine
+        renders the whole signal with a single transform, so its blocks
+        are slices of the full signal held in memory
+        """
+        if self._signal is not None or self.engine == "ifft":
+            for start in range(0, self.n_samples, block_size):
+                yield self.signal[start:start + block_size]
+            return
+        if self.loop_length:
+            period = self._period()
+            for start in range(0, self.n_samples, block_size):
+                stop = min(start + block_size, self.n_samples)
+                yield period.take(np.arange(start, stop), mode='wrap')
+            return
+        with self._executor() as executor:
+            for start in range(0, self.n_samples, block_size):
+                samples = min(block_size, self.n_samples - start)
+                yield self._render_block(executor, start, samples)
+
+    def peak(self, block_size=DEFAULT_BLOCK_SIZE):
+        """ Maximum absolute value of the signal, rendered block by block if needed """
+        if self._signal is not None:
+            return np.max(np.abs(self._signal))
+        if self.loop_length:
+            return np.max(np.abs(self._period()))
+        return max(np.max(np.abs(block)) for block in self.iter_blocks(block_size))
+
+    def peak_bound(self):
+        """
+        Upper bound of the peak from the amplitudes and wavetables,
+        without rendering the signal. Only reached when all the
+        component peaks line up. Cubic interpolation can overshoot the
+        table values, so their peak is scaled by the largest overshoot
+        """
+        if self.engine == "ifft":
+            return self.peak()
+        overshoot = INTERPOLATION_OVERSHOOT[self.interpolation]
+        return overshoot * sum(
+            abs(amp) * np.max(np.abs(table))
+            for table, amp, _, _ in self._oscillators()
+        )
+
+    def export(self, path, bit_depth=16, block_size=None, peak_bound=False):
+        """
+        Save the peak-normalized signal to path. If the signal has not
+        been rendered in memory, or a block_size is given, it is written
+        block by block: the peak is found with a first pass over the
+        blocks, or estimated by peak_bound() when peak_bound is True.
+        In loop mode, the loop points are saved in a smpl chunk of the wav
+        """
+        with span("export"):
+            self._export(path, bit_depth, block_size, peak_bound)
+
+    def _export(self, path, bit_depth, block_size, peak_bound):
+        if self._signal is not None and block_size is None:
+            write(self.scaled_signal, path, samplerate=self.samplerate, bit_depth=bit_depth)
+        else:
+            block_size = block_size or DEFAULT_BLOCK_SIZE
+            peak = self.peak_bound() if peak_bound else self.peak(block_size)
+            write_blocks(
+                (block / peak for block in self.iter_blocks(block_size)),
+                path, samplerate=self.samplerate, bit_depth=bit_depth
+            )
+        length = self.loop_length
+        if length:
+            if Path(path).suffix.lower() == ".wav":
+                write_loop_points(path, 0, length - 1, samplerate=self.samplerate)
+            else:
+                createlog.warning(
+                    "Loop points are only saved in wav files, not in {}".format(path))
@@ -12,10 +12,10 @@ from .settings.plot import (
     figure_generator,
     colors,
     FONT_PROP,
-    AMP_THRESHOLD,
     PLOT_MARGIN,
     CLOSE_LOG_LABEL_TOLERANCE
 )
+from .constants import AMP_THRESHOLD
 from .settings.logging_settings import plotterlog
 from .utils.labels import (sparse_major_freqs,
                            hz_to_note,
@@ -28,8 +28,14 @@ class SignalPlotter(Signal):
                  plotting_interface,
                  input_file,
                  with_envelope=False,
-                 fname='view'):
-        super().__init__(input_file, with_envelope)
+                 fname='view',
+                 start=None,
+                 end=None,
+                 mmap=False,
+                 welch=None):
+        super().__init__(
+            input_file, with_envelope,
+            start=start, end=end, mmap=mmap, welch=welch)
 
         self.y_label = "{} Channel (t)".format("Mono" if self.MONO else "Left")
         self.x_label = "t [sec]"
@@ -38,7 +44,8 @@ class SignalPlotter(Signal):
         self.save_img_prefix = fname
         self.n_figures = 1 if self.MONO else 2
         self.figures = dict()
-        self.time_range = np.linspace(0., self.duration, self.samples)
+        self.time_range = np.linspace(
+            self.offset, self.offset + self.duration, self.samples)
 
     def _create_figures(self, size=figure_size_single, n_figures=None):
         number_of_figures = self.n_figures if not n_figures else n_figures
@@ -117,7 +124,8 @@ class SignalPlotter(Signal):
         for ax, channel, in zip(axes, self.CHANNELS.values()):
             Pxx, freqs, bins, im = ax.specgram(
                 channel, NFFT=npoints, Fs=self.sampling_rate,
-                noverlap=overlap, cmap=self.plt.cm.jet)
+                noverlap=overlap, cmap=self.plt.cm.jet,
+                xextent=(self.time_range[0], self.time_range[-1]) if self.offset else None)
             ax.set_xlabel(self.x_label, fontproperties=FONT_PROP)
             ax.set_ylabel("Frequency [kHz]", fontproperties=FONT_PROP)
             ax.set_ylim(20., 20000.)
@@ -129,7 +137,8 @@ class SignalPlotter(Signal):
         freqs, pws = data
         major_freqs = sparse_major_freqs(
             freqs, pws, threshold=threshold, close_tolerance=close_tolerance)
-        major_labels = {hz_to_note(x): x for x in major_freqs[::-1]}
+        major_freqs = major_freqs[::-1]
+        major_labels = dict(zip(hz_to_note(major_freqs).tolist(), major_freqs))
         x_labels = list(major_labels.keys())
         x_ticks = list(major_labels.values())
         return x_ticks, x_labels
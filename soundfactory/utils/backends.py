@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import platform
+import importlib
+
+import numpy as np
+
+from soundfactory.settings.config import BACKEND_CHOICE_PATH, BACKEND_ENV_VAR
+from soundfactory.settings.signal import B_N_COEFF_MAP, SYNTHESIS_BACKENDS
+from soundfactory.settings.logging_settings import createlog
+
+AUTO = "auto"
+
+# Modules providing fourier_period and phase_accumulator, with the same
+# signatures. The ifft backend renders through SignalBuilder's ifft engine
+KERNEL_MODULES = {
+    "cython": "soundfactory.cyutils.builder_utils",
+    "numba": "soundfactory.utils.builder_utils",
+    "numpy": "soundfactory.utils.np_builder_utils",
+}
+
+_KERNELS = dict()
+_FASTEST = dict()
+
+
+class BackendNotAvailable(Exception):
+    def __init__(self, backend, reason):
+        self.message = "{} backend not available: {}".format(backend, reason)
+
+    def __str__(self):
+        return self.message
+
+
+def load_kernels(backend):
+    """ Module with the kernels of backend, imported on first use """
+    if backend not in _KERNELS:
+        if backend not in KERNEL_MODULES:
+            raise BackendNotAvailable(backend, "it has no kernel module")
+        try:
+            _KERNELS[backend] = importlib.import_module(KERNEL_MODULES[backend])
+        except ImportError as e:
+            raise BackendNotAvailable(backend, e)
+    return _KERNELS[backend]
+
+
+def available_backends():
+    """ Kernel backends that can be imported here, in preference order """
+    available = list()
+    for backend in KERNEL_MODULES:
+        try:
+            load_kernels(backend)
+        except BackendNotAvailable:
+            continue
+        available.append(backend)
+    return available
+
+
+def machine_id():
+    return "{}-{}-py{}".format(
+        platform.node(), platform.machine(), platform.python_version())
+
+
+def benchmark_backend(backend, n_max=200, table_size=4096, samples=2 ** 16, repeat=3):
+    """ Best time of repeat runs of a wavetable and a component render """
+    kernels = load_kernels(backend)
+    terms = np.arange(1, n_max + 1, dtype=np.int64)
+    coefficients = np.asarray(B_N_COEFF_MAP["sawtooth"](terms), dtype=np.float64)
+    times = np.linspace(0.0, 1.0, table_size, endpoint=False, dtype=np.float64)
+
+    def run():
+        table = kernels.fourier_period(1., 0., 1., times, coefficients, terms)
+        kernels.phase_accumulator(440., 44100., table, samples, phase=.25, start=0, order=1)
+
+    # the first run pays for numba compilation
+    run()
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def _read_choices(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def fastest_backend(path=BACKEND_CHOICE_PATH):
+    """
+    Fastest available kernel backend on this machine. The backends are
+    benchmarked only the first time, the winner is stored in path
+    """
+    key = machine_id()
+    if (key, path) in _FASTEST:
+        return _FASTEST[key, path]
+    choices = _read_choices(path) if path is not None else dict()
+    available = available_backends()
+    backend = choices.get(key)
+    if backend not in available:
+        if not available:
+            raise BackendNotAvailable(AUTO, "no kernel backend can be imported")
+        timings = {b: benchmark_backend(b) for b in available}
+        createlog.info("Backend timings: {}".format(
+            ", ".join("{} {:.4f} s".format(b, t) for b, t in timings.items())))
+        backend = min(timings, key=timings.get)
+        if path is not None:
+            choices[key] = backend
+            try:
+                with open(path, "w") as f:
+                    json.dump(choices, f, indent=2)
+            except OSError as e:
+                # a read-only install: the choice lasts for this process
+                createlog.warning(
+                    "Could not save the backend choice in {}: {}".format(path, e))
+    _FASTEST[key, path] = backend
+    return backend
+
+
+def resolve_backend(backend=None):
+    """
+    Name of the backend to use: backend if given, else the one in the
+    BACKEND_ENV_VAR environment variable, else cython when the extension
+    is compiled. "auto" (or no compiled extension) picks the fastest one
+    """
+    if backend is None:
+        backend = os.environ.get(BACKEND_ENV_VAR) or None
+    if backend is None:
+        try:
+            load_kernels("cython")
+            backend = "cython"
+        except BackendNotAvailable:
+            backend = AUTO
+    if backend not in SYNTHESIS_BACKENDS + (AUTO,):
+        raise BackendNotAvailable(
+            backend, "it must be one of {}".format(SYNTHESIS_BACKENDS + (AUTO,)))
+    if backend == AUTO:
+        backend = fastest_backend()
+    return backend
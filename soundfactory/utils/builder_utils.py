@@ -25,7 +25,65 @@ def upsample_component(amp, phase, duration, times, coefficients, terms):
     return np.asarray(period, dtype=np.float64)
 
 
+@njit(nogil=True)
+def fourier_period(amp, phase, duration, times, coefficients, terms):
+    """ evaluate the partial sum on the whole period table in one pass """
+    alphas = 2 * np.pi * times / duration + np.radians(phase)
+    res = np.zeros(times.shape[0], dtype=np.float64)
+    for i in range(times.shape[0]):
+        part_sum = 0.0
+        for k in range(terms.shape[0]):
+            part_sum += coefficients[k] * np.sin(terms[k] * alphas[i])
+        res[i] = amp * part_sum
+    return res
+
+
 def single_component(freq, duration, upsampled, samples):
     cycles = freq * duration
     indexes = (np.round((np.arange(0, samples) * cycles)) % samples).astype(np.int64)
     return upsampled[indexes]
+
+
+@njit(nogil=True)
+def table_lookup(table, position, order):
+    """ read the periodic table at a fractional position """
+    size = table.shape[0]
+    j = int(position)
+    frac = position - j
+    if order == 0:
+        return table[(j + (1 if frac >= 0.5 else 0)) % size]
+    y0, y1 = table[j % size], table[(j + 1) % size]
+    if order == 1:
+        return y0 + frac * (y1 - y0)
+    ym1, y2 = table[(j + size - 1) % size], table[(j + 2) % size]
+    return (
+        ((0.5 * (y2 - ym1) + 1.5 * (y0 - y1)) * frac
+         + (ym1 - 2.5 * y0 + 2 * y1 - 0.5 * y2)) * frac
+        + 0.5 * (y1 - ym1)
+    ) * frac + y0
+
+
+@njit(nogil=True)
+def accumulate(out, table, increment, phase, start, order):
+    """ fill out with the table read from start, in the precision of out """
+    size = table.shape[0]
+    for i in range(out.shape[0]):
+        cycle = (start + i) * increment + phase
+        cycle = cycle - np.floor(cycle)
+        out[i] = table_lookup(table, cycle * size, order)
+    return out
+
+
+def phase_accumulator(
+        freq, samplerate, table, samples, phase=0., start=0, order=1,
+        dtype=np.float64
+):
+    """ read the period in table at freq, starting from phase (in cycles) """
+    if order not in (0, 1, 3):
+        raise ValueError("order must be 0, 1 or 3, not {}".format(order))
+    if table.shape[0] == 0:
+        raise ValueError("empty table")
+    res = np.empty(samples, dtype=dtype)
+    if res.dtype not in (np.float32, np.float64):
+        raise ValueError("dtype must be float32 or float64, not {}".format(res.dtype))
+    return accumulate(res, table, freq / samplerate, phase, start, order)
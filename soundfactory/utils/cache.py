@@ -0,0 +1,647 @@
+import os
+import sys
+import json
+import time
+import pickle
+import sqlite3
+import atexit
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from collections import Counter
+from collections.abc import MutableMapping
+
+import numpy as np
+from cachetools import LRUCache, LFUCache, TTLCache
+
+from soundfactory.settings.config import (
+    CACHE_POLICIES, CACHE_POLICY, CACHE_MEMORY_BYTES, CACHE_DISK_BYTES, CACHE_TTL,
+    CACHE_INDEX
+)
+from soundfactory.settings.logging_settings import helperlog
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory locks (Windows): processes should not share a cache
+    fcntl = None
+
+INDEX_FILE = "index.jsonl"
+SQLITE_INDEX_FILE = "index.sqlite"
+LOCK_FILE = "lock"
+STATS_FILE = "stats.json"
+
+
+@contextmanager
+def file_lock(path):
+    """ Hold an exclusive advisory lock on path, created if needed """
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def sizeof(value):
+    """ Bytes taken by a cached value: its arrays, or its own size """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    arrays = [x for x in getattr(value, "__dict__", {}).values()
+              if isinstance(x, np.ndarray)]
+    return sys.getsizeof(value) + sum(x.nbytes for x in arrays)
+
+
+class _CountEvictions:
+    # cachetools caches evict calling popitem, and drop
+    # the entries older than their ttl in expire
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.evictions = 0
+        self.expirations = 0
+
+    def popitem(self):
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+    def expire(self, *args, **kwargs):
+        size = len(self)
+        expired = super().expire(*args, **kwargs)
+        self.expirations += size - len(self)
+        return expired
+
+
+class LRUMemoryCache(_CountEvictions, LRUCache):
+    pass
+
+
+class LFUMemoryCache(_CountEvictions, LFUCache):
+    pass
+
+
+class TTLMemoryCache(_CountEvictions, TTLCache):
+    pass
+
+
+def memory_cache(policy=CACHE_POLICY, max_bytes=CACHE_MEMORY_BYTES, ttl=CACHE_TTL):
+    """ In-memory cache holding at most max_bytes of values """
+    if policy == "lru":
+        return LRUMemoryCache(max_bytes, getsizeof=sizeof)
+    if policy == "lfu":
+        return LFUMemoryCache(max_bytes, getsizeof=sizeof)
+    if policy == "ttl":
+        return TTLMemoryCache(max_bytes, ttl, getsizeof=sizeof)
+    raise ValueError(
+        "{} cache policy not supported. It must be one of {}".format(
+            policy, CACHE_POLICIES))
+
+
+class CacheStore(MutableMapping):
+    """
+    On-disk cache keeping every entry in its own file, named after the
+    hash of its key: numeric arrays as .npy, anything else pickled.
+
+    A small append-only index (one json line per entry, or per deletion)
+    maps the keys to their files. Files are written to a temporary name
+    and renamed, so that an entry is either complete or missing, and a
+    cache miss only writes the new entry.
+
+    Nothing is read when the store is created: the index is loaded on the
+    first lookup and, with mmap=True, arrays are returned as read-only
+    memory maps of their files, so that only the samples actually used
+    are paged in.
+
+    With a max_bytes budget, entries are evicted to make room for new
+    ones following policy: the least recently used (lru), the least
+    often used (lfu) or the oldest (ttl). With the ttl policy, entries
+    older than ttl seconds are also dropped when looked up.
+
+    Threads and processes can share a store: index updates and evictions
+    happen holding a lock on the lock file of the store, while entries
+    are written to their temporary file beforehand, without the lock
+    """
+
+    def __init__(self, path, mmap=True, max_bytes=None, policy="lru", ttl=None):
+        if policy not in CACHE_POLICIES:
+            raise ValueError(
+                "{} cache policy not supported. It must be one of {}".format(
+                    policy, CACHE_POLICIES))
+        self.path = Path(path)
+        self.mmap = mmap
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.ttl = ttl
+        self.stats = Counter(hits=0, misses=0, evictions=0, expirations=0)
+        self._index = None
+        # bytes of the index file already read, and its inode: compact
+        # replaces the file, and it is then read again from the start
+        self._offset = 0
+        self._inode = None
+        self._nbytes = 0
+        # last use and number of uses of the entries, in this process
+        self._used = dict()
+        self._uses = Counter()
+        self._lock = threading.RLock()
+
+    @property
+    def index_path(self):
+        return self.path / INDEX_FILE
+
+    @property
+    def index(self):
+        if self._index is None:
+            self.refresh()
+        return self._index
+
+    def _add_entry(self, entry):
+        self._drop_entry(entry["key"])
+        self._index[entry["key"]] = entry
+        self._nbytes += entry["bytes"]
+        self._used[entry["key"]] = entry.get("time", 0.)
+
+    def _drop_entry(self, key):
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._nbytes -= entry["bytes"]
+            self._used.pop(key, None)
+            self._uses.pop(key, None)
+        return entry
+
+    def _reset_index(self):
+        # forget what was read from an index file that has been replaced
+        self._index = dict()
+        self._nbytes = 0
+        self._used = dict()
+        self._offset = 0
+
+    def refresh(self):
+        """
+        Read the entries appended to the index since the last read, or
+        the whole index if another store has compacted it meanwhile
+        """
+        with self._lock:
+            if self._index is None:
+                self._index = dict()
+            try:
+                with open(self.index_path, "rb") as f:
+                    info = os.fstat(f.fileno())
+                    if info.st_ino != self._inode or info.st_size < self._offset:
+                        uses = self._uses
+                        self._reset_index()
+                        self._inode = info.st_ino
+                    else:
+                        uses = None
+                    f.seek(self._offset)
+                    lines = f.read()
+            except FileNotFoundError:
+                if self._offset:
+                    self._reset_index()
+                    self._inode = None
+                return
+            for line in lines.splitlines(keepends=True):
+                if not line.endswith(b"\n"):
+                    # still being written
+                    break
+                self._offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # a line left halfway by an interrupted write
+                    continue
+                if entry.get("deleted"):
+                    self._drop_entry(entry["key"])
+                else:
+                    self._add_entry(entry)
+            if uses is not None:
+                # the uses counted in this process still apply
+                self._uses = Counter(
+                    {key: n for key, n in uses.items() if key in self._index})
+
+    def _append_index(self, entry):
+        line = (json.dumps(entry) + "\n").encode()
+        with open(self.index_path, "a+b") as f:
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # do not glue the entry to a line left halfway
+                    line = b"\n" + line
+            f.write(line)
+            # appended holding the lock, after a refresh
+            self._offset = f.tell()
+            self._inode = os.fstat(f.fileno()).st_ino
+
+    @staticmethod
+    def file_name(key, value):
+        digest = hashlib.sha1(str(key).encode()).hexdigest()
+        is_array = isinstance(value, np.ndarray) and not value.dtype.hasobject
+        return digest + (".npy" if is_array else ".pickle")
+
+    @staticmethod
+    def _dump(value, f):
+        if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+            np.save(f, value, allow_pickle=False)
+        else:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _load(self, path):
+        if path.suffix == ".npy":
+            return np.load(
+                path, mmap_mode="r" if self.mmap else None, allow_pickle=False)
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def _expired(self, entry):
+        return (
+            self.policy == "ttl" and self.ttl is not None
+            and time.time() - entry.get("time", 0.) > self.ttl
+        )
+
+    @contextmanager
+    def _locked(self):
+        # threads of this process, then the other processes
+        with self._lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            with file_lock(self.path / LOCK_FILE):
+                # entries added by the other processes count in the budget
+                self.refresh()
+                yield
+
+    def _lookup(self, key):
+        entry = self.index.get(key)
+        if entry is None:
+            # it could have been added by another process
+            self.refresh()
+            entry = self.index.get(key)
+        return entry
+
+    def _touch(self, key):
+        with self._lock:
+            self._used[key] = time.time()
+            self._uses[key] += 1
+
+    def _insert(self, entry):
+        self._append_index(entry)
+        self._add_entry(entry)
+
+    def _delete(self, key):
+        self.index
+        entry = self._drop_entry(key)
+        if entry is not None:
+            self._append_index({"key": key, "deleted": True})
+        return entry
+
+    def _keys(self):
+        return list(self.index)
+
+    def _victim(self, exclude):
+        keys = [k for k in self._index if k != exclude]
+        if not keys:
+            return None
+        if self.policy == "lfu":
+            return min(keys, key=lambda k: (self._uses[k], self._used[k]))
+        if self.policy == "ttl":
+            return min(keys, key=lambda k: self._index[k].get("time", 0.))
+        return min(keys, key=self._used.get)
+
+    def __getitem__(self, key):
+        entry = self._lookup(key)
+        if entry is not None and self._expired(entry):
+            self._remove(key)
+            self.stats["expirations"] += 1
+            entry = None
+        if entry is None:
+            self.stats["misses"] += 1
+            raise KeyError(key)
+        try:
+            value = self._load(self.path / entry["file"])
+        except FileNotFoundError:
+            helperlog.debug("Cache file of {} is missing".format(key))
+            with self._locked():
+                self._delete(key)
+            self.stats["misses"] += 1
+            raise KeyError(key)
+        self.stats["hits"] += 1
+        self._touch(key)
+        return value
+
+    def _evict(self, key):
+        # to be called holding the lock: the file of a key has always
+        # the same name, and could be written again right after
+        entry = self._delete(key)
+        if entry is None:
+            raise KeyError(key)
+        try:
+            (self.path / entry["file"]).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _remove(self, key):
+        with self._locked():
+            self._evict(key)
+
+    def _make_room(self, size, exclude=None):
+        # evict entries until size more bytes fit in the budget
+        while self.nbytes() + size > self.max_bytes:
+            victim = self._victim(exclude)
+            if victim is None:
+                break
+            self._evict(victim)
+            self.stats["evictions"] += 1
+
+    def __setitem__(self, key, value):
+        name = self.file_name(key, value)
+        self.path.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                self._dump(value, f)
+            size = os.stat(tmp).st_size
+            if self.max_bytes is not None and size > self.max_bytes:
+                helperlog.debug("{} bytes entry does not fit in the cache".format(size))
+                os.unlink(tmp)
+                return
+            with self._locked():
+                if self.max_bytes is not None:
+                    self._make_room(size, exclude=key)
+                os.replace(tmp, self.path / name)
+                self._insert(
+                    {"key": key, "file": name, "bytes": size, "time": time.time()})
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        helperlog.debug("Cache entry {} saved".format(name))
+
+    def __delitem__(self, key):
+        self._remove(key)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not None
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def nbytes(self):
+        """ Size on disk of the entries """
+        self.index
+        return self._nbytes
+
+    def compact(self):
+        """ Rewrite the index without the deleted and overwritten entries """
+        with self._locked():
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                for entry in self.index.values():
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(tmp, self.index_path)
+            info = self.index_path.stat()
+            self._offset, self._inode = info.st_size, info.st_ino
+
+    def prune(self, max_age=None, max_bytes=None):
+        """
+        Evict the entries older than max_age seconds, then the ones picked
+        by the policy until the store fits in max_bytes. Returns the
+        number of entries evicted
+        """
+        evicted = 0
+        with self._locked():
+            if max_age is not None:
+                now = time.time()
+                for key, entry in list(self.index.items()):
+                    if now - entry.get("time", 0.) > max_age:
+                        self._evict(key)
+                        evicted += 1
+            while max_bytes is not None and self.nbytes() > max_bytes:
+                victim = self._victim(None)
+                if victim is None:
+                    break
+                self._evict(victim)
+                evicted += 1
+        self.stats["evictions"] += evicted
+        return evicted
+
+    def saved_stats(self):
+        """ Counters saved by save_stats, for all the processes so far """
+        try:
+            with open(self.path / STATS_FILE) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+
+    def save_stats(self, counts):
+        """ Add counts, a dict of counters by cache layer, to the saved ones """
+        with self._locked():
+            saved = self.saved_stats()
+            for layer, counter in counts.items():
+                totals = Counter(saved.get(layer, dict()))
+                totals.update(counter)
+                saved[layer] = dict(totals)
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(saved, f)
+            os.replace(tmp, self.path / STATS_FILE)
+
+
+class SQLiteCacheStore(CacheStore):
+    """
+    CacheStore indexed by a SQLite database, which also records when and
+    how often each entry is used: the lru and lfu policies then account
+    for the uses in every process sharing the cache
+    """
+
+    def __init__(self, path, mmap=True, max_bytes=None, policy="lru", ttl=None):
+        super().__init__(path, mmap=mmap, max_bytes=max_bytes, policy=policy, ttl=ttl)
+        self._connection = None
+        self._pid = None
+
+    @property
+    def index_path(self):
+        return self.path / SQLITE_INDEX_FILE
+
+    @property
+    def db(self):
+        # a connection can not be shared with a forked process
+        if self._connection is None or self._pid != os.getpid():
+            self.path.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(
+                str(self.index_path), timeout=30,
+                isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, file TEXT NOT NULL, bytes INTEGER NOT NULL, "
+                "time REAL NOT NULL, used REAL NOT NULL, uses INTEGER NOT NULL)"
+            )
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def _query(self, sql, *args):
+        with self._lock:
+            return self.db.execute(sql, args).fetchall()
+
+    @property
+    def index(self):
+        return {
+            key: {"key": key, "file": file, "bytes": size, "time": created}
+            for key, file, size, created in self._query(
+                "SELECT key, file, bytes, time FROM entries")
+        }
+
+    def refresh(self):
+        pass
+
+    def _lookup(self, key):
+        rows = self._query(
+            "SELECT file, bytes, time FROM entries WHERE key = ?", key)
+        if not rows:
+            return None
+        file, size, created = rows[0]
+        return {"key": key, "file": file, "bytes": size, "time": created}
+
+    def _touch(self, key):
+        self._query(
+            "UPDATE entries SET used = ?, uses = uses + 1 WHERE key = ?",
+            time.time(), key)
+
+    def _insert(self, entry):
+        self._query(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, 0)",
+            entry["key"], entry["file"], entry["bytes"], entry["time"], entry["time"])
+
+    def _delete(self, key):
+        entry = self._lookup(key)
+        if entry is not None:
+            self._query("DELETE FROM entries WHERE key = ?", key)
+        return entry
+
+    def _keys(self):
+        return [key for key, in self._query("SELECT key FROM entries")]
+
+    def _victim(self, exclude):
+        order = {"lru": "used", "lfu": "uses, used", "ttl": "time"}[self.policy]
+        rows = self._query(
+            "SELECT key FROM entries WHERE key IS NOT ? ORDER BY {} LIMIT 1".format(order),
+            exclude)
+        return rows[0][0] if rows else None
+
+    def nbytes(self):
+        return self._query("SELECT COALESCE(SUM(bytes), 0) FROM entries")[0][0]
+
+    def compact(self):
+        self._query("VACUUM")
+
+
+class TieredCache(MutableMapping):
+    """
+    A byte-budgeted in-memory cache (see memory_cache) in front of a
+    CacheStore: lookups missing in memory are read from the store and
+    kept in memory, new entries are saved in both
+    """
+
+    def __init__(self, memory, store):
+        self.memory = memory
+        self.store = store
+        self.memory_stats = Counter(hits=0, misses=0)
+        # counters already added to the saved stats
+        self._saved = {"memory": Counter(), "disk": Counter()}
+        self._lock = threading.RLock()
+
+    def _remember(self, key, value):
+        with self._lock:
+            try:
+                self.memory[key] = value
+            except ValueError:
+                # larger than the whole memory budget
+                pass
+
+    def __getitem__(self, key):
+        with self._lock:
+            try:
+                value = self.memory[key]
+            except KeyError:
+                self.memory_stats["misses"] += 1
+            else:
+                self.memory_stats["hits"] += 1
+                return value
+        value = self.store[key]
+        self._remember(key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        self.store[key] = value
+        self._remember(key, value)
+
+    def __delitem__(self, key):
+        with self._lock:
+            self.memory.pop(key, None)
+        del self.store[key]
+
+    def __contains__(self, key):
+        return key in self.memory or key in self.store
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+    @property
+    def stats(self):
+        """ Hits, misses, evictions and expirations of the two layers """
+        memory = dict(
+            self.memory_stats,
+            evictions=self.memory.evictions,
+            expirations=self.memory.expirations,
+            bytes=self.memory.currsize,
+            max_bytes=self.memory.maxsize,
+        )
+        disk = dict(
+            self.store.stats,
+            bytes=self.store.nbytes(),
+            max_bytes=self.store.max_bytes,
+        )
+        return {"memory": memory, "disk": disk}
+
+    def save_stats(self):
+        """
+        Add the hits, misses, evictions and expirations counted since the
+        last call to the stats saved in the store
+        """
+        with self._lock:
+            counts = {
+                "memory": Counter(
+                    self.memory_stats,
+                    evictions=self.memory.evictions,
+                    expirations=self.memory.expirations,
+                ),
+                "disk": Counter(self.store.stats),
+            }
+            new = {layer: counts[layer] - self._saved[layer] for layer in counts}
+            if any(new.values()):
+                self.store.save_stats(new)
+            self._saved = counts
+
+
+def configured_cache(path, mmap=True):
+    """
+    Memory and disk cache in path, with the settings in settings.config.
+    With mmap=False arrays are read in memory, and can be written to
+    """
+    store = SQLiteCacheStore if CACHE_INDEX == "sqlite" else CacheStore
+    cache = TieredCache(
+        memory_cache(CACHE_POLICY, CACHE_MEMORY_BYTES, CACHE_TTL),
+        store(path, mmap=mmap, max_bytes=CACHE_DISK_BYTES, policy=CACHE_POLICY,
+              ttl=CACHE_TTL)
+    )
+    # the hit and miss counts of every run add up, see soundfactory cache stats
+    atexit.register(cache.save_stats)
+    return cache
@@ -1,4 +1,7 @@
+import json
 import pickle
+import numbers
+import threading
 from pathlib import Path
 import hashlib
 
@@ -10,9 +13,18 @@ from soundfactory.constants import (
     BASE,
     SEMITONE_CENTS,
     QUARTERTONE_CENTS,
+    DEFAULT_WELCH_SEGMENT,
+    DEFAULT_WELCH_OVERLAP,
+    DEFAULT_WELCH_WINDOW,
+)
+from soundfactory.settings.config import (
+    BUILDER_CACHE_PATH,
+    CACHE_FREQ_QUANTUM,
+    CACHE_PHASE_QUANTUM,
+    CACHE_VALUE_QUANTUM
 )
-from soundfactory.settings.config import BUILDER_CACHE_PATH
 from soundfactory.settings.logging_settings import helperlog
+from soundfactory.utils.profiling import span, count
 
 
 def cents_from_freq_ratio(upper_tone, lower_tone):
@@ -50,6 +62,60 @@ def spectrum(signal, samplerate):
     return freqs[freqs_mask], pws[freqs_mask]
 
 
+def welch_spectrum(
+        blocks, samplerate,
+        nperseg=DEFAULT_WELCH_SEGMENT,
+        overlap=DEFAULT_WELCH_OVERLAP,
+        window=DEFAULT_WELCH_WINDOW
+):
+    """
+    Averaged periodogram (Welch) of a signal given as consecutive blocks
+    of samples, of any size: only a block and less than a segment are
+    held in memory. Powers are scaled as in spectrum, so that a sine of
+    amplitude A peaks at A**2 / 2, with a resolution of samplerate /
+    nperseg Hz. A signal shorter than nperseg is a single segment
+
+    Params
+    ------
+    blocks (iterable of arrays) -- 1-D, or 2-D with a column per channel
+    samplerate (float) -- points per second
+    nperseg (int) -- samples in each segment
+    overlap (float) -- fraction of each segment shared with the next one
+    window (str or tuple) -- any window of scipy.signal.get_window
+
+    Returns
+    -------
+    freqs, pws (with a column per channel for 2-D blocks)
+
+    """
+    # scipy.signal takes most of the import time of this module
+    from scipy.signal import get_window
+    step = max(nperseg - int(round(overlap * nperseg)), 1)
+    taper = get_window(window, nperseg)
+    total, segments = 0., 0
+    rest = None
+    for block in blocks:
+        block = np.asarray(block)
+        rest = block if rest is None else np.concatenate((rest, block))
+        n = (len(rest) - nperseg) // step + 1 if len(rest) >= nperseg else 0
+        if n:
+            frames = np.lib.stride_tricks.sliding_window_view(
+                rest[:(n - 1) * step + nperseg], nperseg, axis=0)[::step]
+            total = total + (np.abs(np.fft.rfft(frames * taper, axis=-1)) ** 2).sum(axis=0)
+            segments += n
+            rest = rest[n * step:]
+    if not segments:
+        if rest is None or not len(rest):
+            raise ValueError("No samples to analyse")
+        nperseg, taper = len(rest), get_window(window, len(rest))
+        total = np.abs(np.fft.rfft(np.moveaxis(rest, 0, -1) * taper, axis=-1)) ** 2
+        segments = 1
+    freqs = np.fft.fftfreq(nperseg, d=1/samplerate)
+    freqs_mask = np.where(freqs >= 0)[0]
+    pws = 2 * total / segments / taper.sum() ** 2
+    return freqs[freqs_mask], np.moveaxis(pws[..., freqs_mask], -1, 0)
+
+
 def progress_bar(
         iteration,
         total,
@@ -130,36 +196,94 @@ def save_cache(cache, path=BUILDER_CACHE_PATH):
     path_obj.parent.mkdir(parents=True, exist_ok=True)
     with open(path, 'wb') as f:
         pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
-        helperlog.debug(f'Cache saved')
+        helperlog.debug('Cache saved')
+
+
+def quantize(value, quantum=CACHE_VALUE_QUANTUM):
+    """ Index of the point of a grid of step quantum closest to value """
+    return int(round(float(value) / quantum))
+
+
+def quantize_phase(phase, quantum=CACHE_PHASE_QUANTUM):
+    # 0 and 360 degrees are the same phase
+    return quantize(phase, quantum) % quantize(360., quantum)
+
+
+def canonical(value):
+    """
+    Representation of a key field that does not depend on its type:
+    numbers (python or numpy) on the CACHE_VALUE_QUANTUM grid, dtypes by
+    name, sequences as lists
+    """
+    if value is None or isinstance(value, (str, bool)):
+        return value
+    if isinstance(value, numbers.Real):
+        return quantize(value)
+    if isinstance(value, np.dtype):
+        return value.name
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [canonical(x) for x in value]
+    return str(value)
+
+
+def hash_key(*fields):
+    """ Fixed size key of the canonical fields """
+    payload = json.dumps(fields, separators=(",", ":")).encode()
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
 
 
 def builder_cache_key(freqs, amps, waves, phases, n_max, samplerate, duration):
     if phases is None:
         phases = [0] * len(freqs)
-    key = sorted(zip(freqs, amps, waves, phases), key=lambda x: x[0])
-    key += [n_max, samplerate, duration]
-    key = '_'.join([str(k) for k in key])
-    return key
+    components = sorted(
+        [quantize(f, CACHE_FREQ_QUANTUM), canonical(a), w, quantize_phase(p)]
+        for f, a, w, p in zip(freqs, amps, waves, phases)
+    )
+    return hash_key(components, *canonical([n_max, samplerate, duration]))
+
+
+def single_component_cache_key(
+        self, freq, phase, wave, n_max, samplerate, duration, *args):
+    # To use on a class method. Components are cached at unit amplitude
+    return hash_key(
+        quantize(freq, CACHE_FREQ_QUANTUM),
+        quantize_phase(phase), wave, *canonical([n_max, samplerate, duration, *args])
+    )
 
 
-def single_component_cache_key(self, freq, amp, wave, phase, n_max, samplerate, duration):
+def wavetable_cache_key(self, wave, n_max, table_size):
     # To use on a class method
-    key = [freq, amp, wave, phase, n_max, samplerate, duration]
-    key = '_'.join([str(k) for k in key])
-    return key
+    return hash_key(wave, *canonical([n_max, table_size]))
+
+
+# Guards the updates and saves of the caches pickled as a whole when
+# components are computed in threads. A CacheStore (or a TieredCache in
+# front of one) locks each entry itself, so that threads writing to the
+# disk do not wait for one another
+CACHE_LOCK = threading.RLock()
 
 
 def cache_it(cache, key_encoder, path=BUILDER_CACHE_PATH):
+    # with path=None the cache is not saved as a whole: either it is
+    # kept in memory only or, as a CacheStore, it saves each entry itself
     def decorator(func):
         def wrapped(*args):
-            key = key_encoder(*args)
-            val = cache.get(key)
+            with span("cache.lookup"):
+                key = key_encoder(*args)
+                val = cache.get(key)
             if val is None:
-                helperlog.debug(f'Value for {key} not found in Cache')
+                count("cache.misses")
+                helperlog.debug('Value for %s not found in Cache', key)
                 val = func(*args)
-                helperlog.debug(f'Setting {val} for {key} in Cache')
-                cache[key] = val
-                save_cache(cache, path)
+                helperlog.debug('Setting value for %s in Cache', key)
+                if path is None:
+                    cache[key] = val
+                else:
+                    with CACHE_LOCK:
+                        cache[key] = val
+                        save_cache(cache, path)
+            else:
+                count("cache.hits")
             return val
         return wrapped
     return decorator
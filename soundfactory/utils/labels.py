@@ -1,30 +1,23 @@
-from soundfactory.utils.scale import build_24_tet_scale_by_sequence
+from functools import lru_cache
 import numpy as np
-from bisect import bisect_left
 from soundfactory.constants import _24_TET_SCALE_INIT
 from matplotlib import ticker
 from soundfactory.utils.helpers import indexes_above_threshold
+from soundfactory.utils.scale import label_info_re, edo_scale
 
-note_hz_24_tet = build_24_tet_scale_by_sequence(
-    list(_24_TET_SCALE_INIT.keys())[-1],
-    list(_24_TET_SCALE_INIT.values())[-1]
-)
-hz_note_24_tet = {v: k for k, v in note_hz_24_tet.items()}
 
-
-def find_closest(sorted_list, x):
-    pos = bisect_left(sorted_list, x)
-    if pos == 0:
-        return sorted_list[0]
-    if pos == len(sorted_list):
-        return sorted_list[-1]
-    before = sorted_list[pos - 1]
-    after = sorted_list[pos]
-    if after - x < x - before:
-        closest = after
-    else:
-        closest = before
-    return closest
+@lru_cache(maxsize=None)
+def note_table(max_octave=10):
+    """
+    Frequencies (ascending) and labels of the 24-TET scale, from the
+    _24_TET_SCALE_INIT note up to G of max_octave
+    """
+    label, freq = list(_24_TET_SCALE_INIT.items())[-1]
+    octave = int(label_info_re(label)[1])
+    labels, freqs = edo_scale(24, label, freq, octave, max_octave)
+    labels = labels.tolist()
+    first, last = labels.index(label), labels.index("G{}".format(max_octave))
+    return freqs[first:last + 1], np.array(labels[first:last + 1])
 
 
 def remove_close_values_on_log_scale(values, tolerance=0.1):
@@ -53,9 +46,17 @@ def remove_close_values_on_log_scale(values, tolerance=0.1):
 
 
 def hz_to_note(x):
-    return hz_note_24_tet[
-        find_closest(sorted(hz_note_24_tet.keys()), x)
-    ]
+    """
+    Label of the closest 24-TET note to the frequency x, or an array of
+    labels for an array of frequencies
+    """
+    freqs, labels = note_table()
+    x = np.asarray(x, dtype=np.float64)
+    pos = np.clip(np.searchsorted(freqs, x), 1, freqs.shape[0] - 1)
+    before, after = freqs[pos - 1], freqs[pos]
+    # halfway between two notes, the lower one
+    notes = labels[np.where(after - x < x - before, pos, pos - 1)]
+    return notes if notes.ndim else str(notes)
 
 
 @ticker.FuncFormatter
@@ -0,0 +1,50 @@
+import numpy as np
+
+# Elements of the (times x terms) matrix evaluated at once by fourier_period
+MATRIX_BLOCK = 2 ** 20
+
+
+def fourier_period(amp, phase, duration, times, coefficients, terms):
+    """ evaluate the partial sum on the whole period table, a block of times at a time """
+    alphas = 2 * np.pi / duration * np.asarray(times) + np.radians(phase)
+    res = np.empty(alphas.shape[0], dtype=np.float64)
+    step = max(1, MATRIX_BLOCK // max(1, terms.shape[0]))
+    for start in range(0, alphas.shape[0], step):
+        res[start:start + step] = np.sin(
+            np.outer(alphas[start:start + step], terms)) @ coefficients
+    return amp * res
+
+
+def table_lookup(table, position, order):
+    """ read the periodic table at an array of fractional positions """
+    size = table.shape[0]
+    j = position.astype(np.int64)
+    frac = position - j
+    if order == 0:
+        return table[(j + (frac >= 0.5)) % size]
+    y0, y1 = table[j % size], table[(j + 1) % size]
+    if order == 1:
+        return y0 + frac * (y1 - y0)
+    ym1, y2 = table[(j + size - 1) % size], table[(j + 2) % size]
+    return (
+        ((0.5 * (y2 - ym1) + 1.5 * (y0 - y1)) * frac
+         + (ym1 - 2.5 * y0 + 2 * y1 - 0.5 * y2)) * frac
+        + 0.5 * (y1 - ym1)
+    ) * frac + y0
+
+
+def phase_accumulator(
+        freq, samplerate, table, samples, phase=0., start=0, order=1,
+        dtype=np.float64
+):
+    """ read the period in table at freq, starting from phase (in cycles) """
+    if order not in (0, 1, 3):
+        raise ValueError("order must be 0, 1 or 3, not {}".format(order))
+    table = np.asarray(table, dtype=np.float64)
+    if table.shape[0] == 0:
+        raise ValueError("empty table")
+    if np.dtype(dtype) not in (np.float32, np.float64):
+        raise ValueError("dtype must be float32 or float64, not {}".format(np.dtype(dtype)))
+    cycle = (start + np.arange(samples)) * (freq / samplerate) + phase
+    cycle -= np.floor(cycle)
+    return table_lookup(table, cycle * table.shape[0], order).astype(dtype, copy=False)
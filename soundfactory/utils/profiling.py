@@ -0,0 +1,99 @@
+import json
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+# Metrics being recorded by profile(), if any. Spans and counters cost
+# a global lookup when nothing is recorded
+_ACTIVE = None
+
+
+class Metrics:
+    """
+    Calls, total and longest time of the spans, and counters (cache hits
+    and misses, bytes allocated by the signals), from any thread
+    """
+
+    def __init__(self):
+        self.spans = dict()
+        self.counters = Counter()
+        self._lock = threading.Lock()
+
+    def add_span(self, name, seconds):
+        with self._lock:
+            calls, total, longest = self.spans.get(name, (0, 0., 0.))
+            self.spans[name] = (calls + 1, total + seconds, max(longest, seconds))
+
+    def add(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def report(self):
+        return {
+            "spans": {
+                name: {"calls": calls, "total": total, "max": longest}
+                for name, (calls, total, longest) in sorted(
+                    self.spans.items(), key=lambda item: -item[1][1])
+            },
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def format(self):
+        """ The report as a table, spans by total time """
+        report = self.report()
+        row = "{:<24} {:>8} {:>12} {:>12}"
+        lines = [row.format("span", "calls", "total [s]", "max [s]")]
+        for name, span in report["spans"].items():
+            lines.append(row.format(
+                name, span["calls"],
+                "{:.4f}".format(span["total"]), "{:.4f}".format(span["max"])))
+        for name, value in report["counters"].items():
+            lines.append("{:<24} {:>8}".format(name, value))
+        return "\n".join(lines)
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+@contextmanager
+def profile():
+    """
+    Record the spans and counters of the code run in the block, in all
+    the threads, in the Metrics it yields
+    """
+    global _ACTIVE
+    previous, metrics = _ACTIVE, Metrics()
+    _ACTIVE = metrics
+    try:
+        yield metrics
+    finally:
+        _ACTIVE = previous
+
+
+@contextmanager
+def span(name):
+    """ Time the block as name, when profiling """
+    metrics = _ACTIVE
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_span(name, time.perf_counter() - start)
+
+
+def count(name, value=1):
+    """ Add value to the name counter, when profiling """
+    metrics = _ACTIVE
+    if metrics is not None:
+        metrics.add(name, value)
+
+
+def allocated(name, array):
+    """ Count the bytes of an array allocated by name, when profiling """
+    count("bytes." + name, array.nbytes)
+    return array
@@ -1,4 +1,6 @@
 import re
+from functools import lru_cache
+import numpy as np
 from soundfactory.utils.helpers import freq_at_n_quartertones
 from soundfactory.constants import SEQUENCE_24, SYMBOLS_24
 
@@ -74,3 +76,47 @@ def build_24_tet_scale_by_sequence(init_label, init_freq, max_octave=10):
         label, freq = scale[-1][0], scale[-1][1]
     return dict(scale)
 
+
+
+def _edo_names(edo):
+    """ Tone and subtone of each step, when the EDO is a subset of 24-TET """
+    if len(SEQUENCE_24) % edo:
+        return None
+    names = SEQUENCE_24[::len(SEQUENCE_24) // edo]
+    return np.array([n[:1] for n in names]), np.array([n[1:] for n in names])
+
+
+@lru_cache(maxsize=None)
+def edo_scale(edo=24, reference="A4", reference_freq=440., min_octave=-1, max_octave=10):
+    """
+    Labels and frequencies of the notes of an equal division of the octave
+    in edo steps, from C of min_octave to the last step of max_octave, as
+    arrays. The step closest to the reference note is tuned to
+    reference_freq, and every other one is 2 ** (steps / edo) away from it,
+    without accumulated rounding.
+
+    EDOs dividing 24 (12, 24, ...) have labels like build_24_tet_scale
+    (C4, C4#, ...), the others are labelled by step above C (C4+7).
+    The arrays are shared by all the calls with the same parameters, and
+    read-only
+    """
+    if edo < 1:
+        raise ValueError("edo must be a positive integer, not {}".format(edo))
+    if min_octave > max_octave:
+        raise ValueError("min_octave {} is above max_octave {}".format(min_octave, max_octave))
+    tone, octave, sub = label_info_re(reference)
+    position = SEQUENCE_24.index(tone + sub) / len(SEQUENCE_24)
+    reference_step = int(octave) * edo + int(round(position * edo))
+    steps = np.arange(min_octave * edo, (max_octave + 1) * edo)
+    freqs = reference_freq * 2. ** ((steps - reference_step) / edo)
+    octaves, degrees = np.divmod(steps, edo)
+    octaves = octaves.astype(str)
+    names = _edo_names(edo)
+    if names is None:
+        labels = np.char.add(np.char.add("C", octaves), np.char.add("+", degrees.astype(str)))
+    else:
+        tones, subtones = names
+        labels = np.char.add(np.char.add(tones[degrees], octaves), subtones[degrees])
+    labels.flags.writeable = False
+    freqs.flags.writeable = False
+    return labels, freqs
@@ -1,20 +1,113 @@
-from scipy.signal import hilbert
+import struct
+from math import floor, gcd
 import soundfile as sf
 import numpy as np
 
+from soundfactory.constants import DEFAULT_LOOP_TOLERANCE
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# dtype of the samples by format and bits per sample
+WAV_DTYPES = {
+    (WAVE_FORMAT_PCM, 8): 'u1',
+    (WAVE_FORMAT_PCM, 16): '<i2',
+    (WAVE_FORMAT_PCM, 32): '<i4',
+    (WAVE_FORMAT_IEEE_FLOAT, 32): '<f4',
+    (WAVE_FORMAT_IEEE_FLOAT, 64): '<f8',
+}
+
 
 def get_envelope(mono_audio):
+    # scipy.signal takes most of the import time of this module
+    from scipy.signal import hilbert
     analytic_audio = hilbert(mono_audio)
     return np.abs(analytic_audio)
 
 
-def load_audio(wavfile):
-    # Load audio
-    f = sf.SoundFile(wavfile)
-    samplerate = f.samplerate
-    # Stereo signal
-    signal = f.read(dtype=np.float32)
-    return signal, samplerate
+def frame_window(start, end, samplerate, frames):
+    """ First and last (excluded) frames from start to end seconds """
+    first = 0 if start is None else int(round(start * samplerate))
+    last = frames if end is None else int(round(end * samplerate))
+    first, last = min(max(first, 0), frames), min(max(last, 0), frames)
+    if last <= first:
+        raise ValueError(
+            "No samples between {} and {} seconds".format(start, end))
+    return first, last
+
+
+def wav_layout(wavfile):
+    """
+    dtype, channels, samplerate, byte offset and number of frames of
+    the samples of an uncompressed wav file, None for any other file
+    """
+    with open(wavfile, 'rb') as f:
+        riff, _, wave = struct.unpack('<4sI4s', f.read(12).ljust(12, b'\0'))
+        if riff != b'RIFF' or wave != b'WAVE':
+            return None
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            chunk_id, size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                data = f.read(size)
+                tag, channels, samplerate, _, block_align, bits = \
+                    struct.unpack('<HHIIHH', data[:16])
+                if tag == WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                    tag = struct.unpack('<H', data[24:26])[0]
+                fmt = tag, channels, samplerate, block_align, bits
+                f.seek(size % 2, 1)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    return None
+                tag, channels, samplerate, block_align, bits = fmt
+                dtype = WAV_DTYPES.get((tag, bits))
+                if dtype is None or block_align != channels * bits // 8:
+                    return None
+                offset = f.tell()
+                # streamed files may leave the size unset
+                size = min(size, f.seek(0, 2) - offset)
+                return np.dtype(dtype), channels, samplerate, offset, size // block_align
+            else:
+                f.seek(size + size % 2, 1)
+
+
+def to_float32(samples):
+    """ Samples scaled to [-1, 1) as float32, as read by soundfile """
+    if samples.dtype.kind == 'f':
+        return samples.astype(np.float32, copy=False)
+    if samples.dtype.kind == 'u':
+        return (samples.astype(np.float32) - 128) / 128
+    return samples.astype(np.float32) / -float(np.iinfo(samples.dtype).min)
+
+
+def load_audio(wavfile, start=None, end=None, mmap=False, raw=False):
+    """
+    Samples (as float32) and samplerate of a wav file, only from start
+    to end seconds if given. With mmap, an uncompressed wav file is
+    mapped in memory instead of read: 32 bits float samples are not
+    even copied, and only the pages in the window are ever read. With
+    raw too, the mapped samples are returned as stored, integers
+    included, for to_float32 to scale a block at a time
+    """
+    layout = wav_layout(wavfile) if mmap else None
+    if layout is None:
+        with sf.SoundFile(wavfile) as f:
+            first, last = frame_window(start, end, f.samplerate, f.frames)
+            f.seek(first)
+            return f.read(frames=last - first, dtype=np.float32), f.samplerate
+    dtype, channels, samplerate, offset, frames = layout
+    first, last = frame_window(start, end, samplerate, frames)
+    samples = np.memmap(
+        wavfile, dtype=dtype, mode='r',
+        offset=offset + first * channels * dtype.itemsize,
+        shape=(last - first, channels)
+    )
+    # mono files are read as 1-D arrays
+    samples = samples[:, 0] if channels == 1 else samples
+    return (samples if raw else to_float32(samples)), samplerate
 
 
 def find_soundfile_subtype(depth, default=16):
@@ -84,11 +177,129 @@ def build_signal(freqs, amps, phases, period=1, samplerate=44100):
     return np.fft.ifft(fft)
 
 
+def build_rfft(freqs, amps, phases, period=1, samplerate=44100):
+    """
+    Build the non-negative half of the fft (see numpy.fft.rfft docs)
+    with the same conventions of build_fft.
+
+    Components falling on the same frequency bin are summed up,
+    components at or above the Nyquist frequency are dropped
+
+    NOTE:
+    freqs, amps and phases must be in the same order to refer to the
+    Fourier component
+    """
+    freqs, amps, phases = np.array(freqs), np.array(amps), np.array(phases)
+    n = np.round(period * samplerate).astype(int)
+    N = (n-1)//2 + 1
+    freq_idx = freq_indexes(freqs, n=n, samplerate=samplerate)
+    idx = np.where((freqs >= 0) & (freq_idx < N))[0]
+    r = np.zeros(n//2 + 1, dtype=np.complex_)
+    np.add.at(r, freq_idx[idx], amps[idx] * n * np.exp(1j * phases[idx]))
+    return r
+
+
+def build_real_signal(freqs, amps, phases, period=1, samplerate=44100):
+    n = np.round(period * samplerate).astype(int)
+    rfft = build_rfft(
+        freqs, amps, phases, period=period, samplerate=samplerate)
+    return np.fft.irfft(rfft, n=n)
+
+
 def write(signal, filename, bit_depth=16, samplerate=44100):
     subtype = find_soundfile_subtype(bit_depth)
     sf.write(filename, signal, samplerate, subtype=subtype)
 
 
+def write_blocks(blocks, filename, bit_depth=16, samplerate=44100, channels=1):
+    """ Write an iterable of arrays one after the other to filename """
+    subtype = find_soundfile_subtype(bit_depth)
+    with sf.SoundFile(
+            filename, mode='w', samplerate=samplerate,
+            channels=channels, subtype=subtype) as f:
+        for block in blocks:
+            f.write(block)
+
+
+def write_loop_points(filename, start, end, samplerate=44100):
+    """
+    Append to a wav file a smpl chunk with a single forward loop
+    from the start to the end sample (included), as read by samplers
+    """
+    sample_period = int(round(1e9 / samplerate))
+    chunk = struct.pack(
+        '<4s10I', b'smpl', 36 + 24,
+        0, 0, sample_period, 60, 0, 0, 0, 1, 0)
+    chunk += struct.pack('<6I', 0, 0, start, end, 0, 0)
+    with open(filename, 'r+b') as f:
+        if f.read(4) != b'RIFF':
+            raise ValueError("{} is not a RIFF wav file".format(filename))
+        f.seek(0, 2)
+        f.write(chunk)
+        riff_size = f.tell() - 8
+        f.seek(4)
+        f.write(struct.pack('<I', riff_size))
+
+
+def read_loop_points(filename):
+    """ (start, end) of the loops in the smpl chunk of a wav file """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    position = 12
+    while position + 8 <= len(data):
+        chunk_id, size = struct.unpack('<4sI', data[position:position + 8])
+        if chunk_id == b'smpl':
+            n_loops = struct.unpack('<I', data[position + 36:position + 40])[0]
+            loops = position + 44
+            return [
+                struct.unpack('<2I', data[loops + 24 * i + 8:loops + 24 * i + 16])
+                for i in range(n_loops)
+            ]
+        position += 8 + size + size % 2
+    return list()
+
+
+def convergents(x, max_denominator):
+    """ Continued fraction convergents p / q of x, with q up to max_denominator """
+    p0, p1, q0, q1 = 0, 1, 1, 0
+    rest = x
+    while True:
+        a = floor(rest)
+        p0, p1 = p1, a * p1 + p0
+        q0, q1 = q1, a * q1 + q0
+        if q1 > max_denominator:
+            return
+        yield p1, q1
+        if rest == a:
+            return
+        rest = 1 / (rest - a)
+
+
+def loop_length(freqs, samplerate, max_length, tolerance=DEFAULT_LOOP_TOLERANCE):
+    """
+    Shortest number of samples after which every one of freqs is back
+    to its starting phase, within tolerance cycles. None if it is longer
+    than max_length samples
+    """
+    length = 1
+    for freq in freqs:
+        ratio = abs(freq) / samplerate
+        period = next(
+            (q for p, q in convergents(ratio, max_length)
+             if abs(ratio * q - p) <= tolerance),
+            None
+        )
+        if period is None:
+            return None
+        length = length * period // gcd(length, period)
+        if length > max_length:
+            return None
+    cycles = np.abs(np.asarray(freqs, dtype=np.float64)) / samplerate * length
+    if np.any(np.abs(cycles - np.round(cycles)) > tolerance):
+        return None
+    return length
+
+
 def write_stereo(left, right, filename, bit_depth=16, samplerate=44100):
     if isinstance(left, str) and isinstance(right, str):
         left, l_samplerate = load_audio(left)
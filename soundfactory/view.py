@@ -2,7 +2,11 @@
 
 import click
 from soundfactory.settings.input_validators import ExistentWav
-from soundfactory.settings.plot import plt, AMP_THRESHOLD
+from soundfactory.settings.plot import plt
+from soundfactory.constants import (
+    AMP_THRESHOLD, DEFAULT_BLOCK_SIZE, DEFAULT_WELCH_SEGMENT,
+    DEFAULT_WELCH_OVERLAP, DEFAULT_WELCH_WINDOW
+)
 from soundfactory.signal_plotter import SignalPlotter
 from soundfactory.settings.logging_settings import viewlog
 
@@ -11,11 +15,13 @@ def view(
         input_file, calculate_envelope,
         msec_window, start, end, mode,
         min_freq, max_freq,
-        threshold, log_pws, save_fig
+        threshold, log_pws, save_fig, mmap=False, welch=None
 ):
 
     """
-    Visualize the signal in an INPUT wav file
+    Visualize the signal in an INPUT wav file, only loading the samples
+    from start to end seconds. welch holds the arguments of the averaged
+    spectrum (see Signal), if any
     """
     filename_no_ext = str(input_file).replace('.wav', '')
     viewlog.info("Loading audio from {}".format(input_file))
@@ -23,9 +29,12 @@ def view(
         plt,
         input_file,
         with_envelope=calculate_envelope,
-        fname=filename_no_ext)
+        fname=filename_no_ext,
+        start=start, end=end, mmap=mmap, welch=welch)
+    resolution = 1. / plotter.duration if welch is None else \
+        plotter.sampling_rate / min(welch["nperseg"], plotter.samples)
     viewlog.info("Frequency resolution: {} Hz"
-                 .format(round(1. / plotter.duration, 2))
+                 .format(round(resolution, 2))
                  )
     viewlog.info("Creating plots")
     plotter.show(
@@ -65,17 +74,42 @@ def view(
     help="amplitude percentage threshold")
 @click.option("--log-pws", flag_value="log_pws", default=False)
 @click.option('--save-fig', is_flag=True)
+@click.option(
+    "--mmap", is_flag=True,
+    help="map uncompressed wav files in memory instead of reading them")
+@click.option(
+    "--welch", is_flag=True,
+    help="average the spectra of overlapping segments (for long files)")
+@click.option(
+    "--segment", default=DEFAULT_WELCH_SEGMENT,
+    metavar="N", type=click.IntRange(min=1),
+    help="samples of each segment averaged by --welch")
+@click.option(
+    "--overlap", default=DEFAULT_WELCH_OVERLAP,
+    metavar="FRACTION", type=click.FloatRange(min=0, max=1, max_open=True),
+    help="fraction of each segment shared with the next one")
+@click.option(
+    "--window", default=DEFAULT_WELCH_WINDOW,
+    metavar="WINDOW", help="window of the segments, as named by scipy")
+@click.option(
+    "--block-size", default=DEFAULT_BLOCK_SIZE,
+    metavar="N", type=click.IntRange(min=1),
+    help="samples read at a time by --welch")
 def main(
         input_file, calculate_envelope,
         msec_window, start, end, mode,
         min_freq, max_freq,
-        threshold, log_pws, save_fig
+        threshold, log_pws, save_fig, mmap,
+        welch, segment, overlap, window, block_size
 ):
     view(
         input_file, calculate_envelope,
         msec_window, start, end, mode,
         min_freq, max_freq,
-        threshold, log_pws, save_fig
+        threshold, log_pws, save_fig, mmap=mmap,
+        welch=dict(
+            nperseg=segment, overlap=overlap, window=window,
+            block_size=block_size) if welch else None
     )
 
 
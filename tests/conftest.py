@@ -85,6 +85,15 @@ def testfile_path():
     os.remove(path)
 
 
+@pytest.fixture
+def empty_caches():
+    # the builders and SoundImage start from empty caches in a temporary
+    # directory, so that nothing is reused from the other tests
+    from soundfactory.bench import isolated_caches
+    with isolated_caches():
+        yield
+
+
 @pytest.fixture
 def mono_audio_file():
     return str(Path(__file__).parent.parent / 'samples' / 'mono_bell.wav')
@@ -1,13 +1,19 @@
 import time
-from numpy import pi, arange, ndarray, round as npround
+from numpy import (
+    pi, arange, ndarray, allclose, sin, concatenate, array_equal,
+    round as npround
+)
 
 from soundfactory.cyutils import builder_utils as cy_builder_utils
 from soundfactory.utils.builder_utils import (
     wn,
     fourier_sum,
     upsample_component,
-    single_component
+    fourier_period,
+    single_component,
+    phase_accumulator
 )
+from soundfactory.utils import np_builder_utils
 from soundfactory.settings.signal import B_N_COEFF_MAP
 from soundfactory.constants import DEFAULT_SAMPLERATE
 from tests.conftest import time_range
@@ -55,6 +61,29 @@ def test_upsample_component(n_max_range, frequencies):
             assert all(mask)
 
 
+def test_fourier_period(n_max_range, frequencies):
+    times = time_range(samples=DEFAULT_SAMPLERATE // 10)
+    for shape in B_N_COEFF_MAP.keys():
+        for n, f in zip(n_max_range, frequencies):
+            terms = arange(1, n + 1)
+            coefficients = B_N_COEFF_MAP[shape](terms)
+            period = cy_builder_utils.fourier_period(
+                0.9, 45., 1., times, coefficients, terms
+            )
+            assert isinstance(period, ndarray)
+            assert allclose(
+                period,
+                cy_builder_utils.upsample_component(
+                    0.9, 45., 1., times, coefficients, terms),
+                rtol=0, atol=1e-10
+            )
+            assert allclose(
+                period,
+                fourier_period(0.9, 45., 1., times, coefficients, terms),
+                rtol=0, atol=1e-10
+            )
+
+
 def test_single_component(n_max_range, frequencies):
     duration = 1.
     n_samples = int(duration * DEFAULT_SAMPLERATE)
@@ -76,3 +105,54 @@ def test_single_component(n_max_range, frequencies):
             assert isinstance(sc, ndarray)
             mask = sc == single_component(f, duration, upsampled, n_samples)
             assert all(mask)
+
+
+def test_phase_accumulator(frequencies):
+    table = sin(2 * pi * arange(4096) / 4096)
+    samples = DEFAULT_SAMPLERATE
+    tolerances = {0: 1e-3, 1: 1e-6, 3: 1e-9}
+    for f in frequencies:
+        exact = sin(2 * pi * (arange(samples) * f / samples + .25))
+        for order, tolerance in tolerances.items():
+            sc = cy_builder_utils.phase_accumulator(
+                f, samples, table, samples, phase=.25, order=order)
+            assert isinstance(sc, ndarray)
+            assert abs(sc - exact).max() < tolerance
+            assert array_equal(
+                sc,
+                phase_accumulator(f, samples, table, samples, .25, 0, order)
+            )
+            # rendering in blocks gives the very same samples
+            blocks = concatenate([
+                cy_builder_utils.phase_accumulator(
+                    f, samples, table, 1000, phase=.25, start=start, order=order)
+                for start in range(0, samples, 1000)
+            ])
+            assert array_equal(blocks[:samples], sc)
+
+
+def test_numpy_kernels(n_max_range, frequencies):
+    times = time_range(samples=4096)
+    table = sin(2 * pi * arange(4096) / 4096)
+    for shape in B_N_COEFF_MAP.keys():
+        for n, f in zip(n_max_range, frequencies):
+            terms = arange(1, n + 1)
+            coefficients = B_N_COEFF_MAP[shape](terms)
+            assert allclose(
+                np_builder_utils.fourier_period(
+                    0.9, 45., 1., times, coefficients, terms),
+                cy_builder_utils.fourier_period(
+                    0.9, 45., 1., times, coefficients, terms),
+                rtol=0, atol=1e-10
+            )
+    for f in frequencies:
+        for order in (0, 1, 3):
+            assert allclose(
+                np_builder_utils.phase_accumulator(
+                    f, DEFAULT_SAMPLERATE, table, 10000,
+                    phase=.25, start=500, order=order),
+                cy_builder_utils.phase_accumulator(
+                    f, DEFAULT_SAMPLERATE, table, 10000,
+                    phase=.25, start=500, order=order),
+                rtol=0, atol=1e-12
+            )
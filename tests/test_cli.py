@@ -0,0 +1,57 @@
+import sys
+import json
+import subprocess
+from click.testing import CliRunner
+from soundfactory.cli import main
+
+
+def test_lazy_imports():
+    # building the CLI must not load the heavy dependencies
+    code = (
+        "import sys, soundfactory.cli; "
+        "print(' '.join(m for m in ('numpy', 'matplotlib', 'scipy', 'PIL') "
+        "if m in sys.modules))"
+    )
+    loaded = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert loaded.stdout.strip() == ""
+
+
+def test_help():
+    runner = CliRunner()
+    for command in ([], ["create"], ["view"], ["play"], ["transform"], ["cache", "warm"], ["bench"]):
+        result = runner.invoke(main, command + ["--help"])
+        assert result.exit_code == 0
+        assert "Usage" in result.output
+
+
+def test_metrics_json(tmp_path):
+    out, metrics = tmp_path / "out.wav", tmp_path / "metrics.json"
+    result = CliRunner().invoke(main, [
+        "--profile", "--metrics-json", str(metrics),
+        "create", "-wc", "440", "1", "-dur", ".1", "-o", str(out)
+    ])
+    assert result.exit_code == 0
+    assert out.is_file()
+    report = json.loads(metrics.read_text())
+    assert "export" in report["spans"] and report["spans"]["export"]["calls"] == 1
+
+
+def test_bench(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    args = ["bench", "--kind", "builder", "-n", "10", "-s", "8000", "-dur", ".1",
+            "-k", "1", "--shape", "sine", "-r", "1"]
+    result = CliRunner().invoke(main, args + ["--save", str(baseline)])
+    assert result.exit_code == 0
+    saved = json.loads(baseline.read_text())
+    assert set(saved["cases"]) == {
+        "builder[n=10,sr=8000,dur=0.1,k=1,sine][cold]",
+        "builder[n=10,sr=8000,dur=0.1,k=1,sine][warm]",
+    }
+    # a baseline 100 times faster must fail the run
+    for case in saved["cases"].values():
+        case["seconds"] /= 100
+    baseline.write_text(json.dumps(saved))
+    result = CliRunner().invoke(main, args + ["--baseline", str(baseline)])
+    assert result.exit_code == 1
+    assert "slower than the baseline" in result.output
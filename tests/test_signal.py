@@ -72,3 +72,75 @@ def test_stereo_input(stereo_audio_file):
     _s = Signal(stereo_audio_file)
     assert not _s.CALCULATE_ENVELOPE
     assert len(_s.ENVELOPES) == 0, _s.ENVELOPES
+
+
+def test_lazy_analysis(mono_audio_file):
+    s = Signal(mono_audio_file, with_envelope=True)
+    assert s.SPECTRA.calculated() == [] and s.ENVELOPES.calculated() == []
+
+    pws = s.SPECTRA['ch1_fft'][s.POWERS]
+    assert s.SPECTRA['ch1_fft'][s.POWERS] is pws
+    assert s.SPECTRA.calculated() == ['ch1_fft']
+    assert s.ENVELOPES.calculated() == []
+
+    # a new array for the channel is analysed again
+    s.CHANNELS['ch1'] = s.CHANNELS['ch1'] * 2
+    assert np.allclose(s.SPECTRA['ch1_fft'][s.POWERS], 4 * pws)
+
+    # changes in place need an explicit invalidation
+    envelope = s.ENVELOPES['ch1_envelope']
+    s.CHANNELS['ch1'] *= .5
+    assert s.ENVELOPES['ch1_envelope'] is envelope
+    s.invalidate('ch1')
+    assert np.allclose(s.ENVELOPES['ch1_envelope'], envelope / 2, atol=1e-5)
+    assert np.allclose(s.SPECTRA['ch1_fft'][s.POWERS], pws, atol=1e-8)
+
+
+def test_window(stereo_audio_file):
+    full = Signal(stereo_audio_file)
+    s = Signal(stereo_audio_file, start=1., end=2.5)
+    assert s.offset == 1.
+    assert s.samples == int(1.5 * s.sampling_rate)
+    assert np.isclose(s.duration, 1.5)
+    start = s.sampling_rate
+    assert np.array_equal(s.CHANNELS['ch2'], full.CHANNELS['ch2'][start:start + s.samples])
+    # the spectrum is the one of the window
+    assert np.isclose(s.SPECTRA['ch1_fft'][s.FREQUENCIES][1], 1 / s.duration)
+
+
+def test_welch(stereo_audio_file):
+    welch = dict(nperseg=4096, overlap=.5, block_size=10000)
+    s = Signal(stereo_audio_file, welch=welch, mmap=True)
+    for ch in ('ch1', 'ch2'):
+        frequency_spectrum = s.SPECTRA[ch + s.FFT_SUFFIX]
+        freqs = frequency_spectrum[s.FREQUENCIES]
+        pws = frequency_spectrum[s.POWERS]
+        assert freqs.size == pws.size == 2048
+        assert np.isclose(freqs[1], s.sampling_rate / 4096)
+        assert np.all(pws >= 0)
+    assert s.welch == welch
+
+
+def test_welch_from_disk(tmp_path):
+    import tracemalloc
+    import soundfile as sf
+    path = str(tmp_path / 'pcm16.wav')
+    rng = np.random.default_rng(0)
+    sf.write(path, rng.uniform(-.5, .5, (800000, 2)), 8000, subtype='PCM_16')
+    welch = dict(nperseg=1024, block_size=4096)
+
+    s = Signal(path, mmap=True, welch=welch)
+    tracemalloc.start()
+    spectra = [s.SPECTRA[ch + s.FFT_SUFFIX][s.POWERS] for ch in ('ch1', 'ch2')]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # read and scaled a block at a time, far less than a float32 channel
+    assert peak < 800000 * 4 / 8
+    assert s.CHANNELS.samples('ch1').dtype == np.int16
+    assert isinstance(s.CHANNELS.samples('ch1'), np.memmap)
+
+    read = Signal(path, welch=welch)
+    for ch, pws in zip(('ch1', 'ch2'), spectra):
+        assert np.allclose(read.SPECTRA[ch + s.FFT_SUFFIX][s.POWERS], pws)
+    # the channels are scaled when used
+    assert np.array_equal(s.CHANNELS['ch1'], read.CHANNELS['ch1'])
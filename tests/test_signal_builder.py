@@ -1,12 +1,19 @@
+import json
 import numpy as np
 from random import random
 
-from soundfactory.utils.signal import load_audio
-from soundfactory.signal_builder import SignalBuilder
+from soundfactory.utils.signal import load_audio, read_loop_points, loop_length
+from soundfactory import signal_builder
+from soundfactory.signal_builder import SignalBuilder, CACHE, WAVETABLES
+from soundfactory.cache import warm
+from soundfactory.utils.scale import build_24_tet_scale
+from soundfactory.utils import backends
+from soundfactory.utils.profiling import profile
 from tests.conftest import (
     sine_wave, square_wave, time_range, sawtooth_wave, triangle_wave
     )
 from soundfactory.constants import DEFAULT_SAMPLERATE
+from soundfactory.settings.signal import FLOAT32_TOLERANCE
 
 
 TIME_RANGE = time_range()
@@ -75,3 +82,276 @@ def test_phase_shift():
             analytic_sig = amp * analytic(freq, phase=phase)
             diff = builder.signal - analytic_sig
             assert abs(diff).mean() < tolerance
+
+
+def test_ifft_engine():
+    # frequencies on the 1 / duration grid are reproduced exactly
+    for freq in [1., 2., 30.]:
+        for analytic, shape, tolerance in WAVES:
+            for phase in [0, 45.7]:
+                builder = SignalBuilder(
+                    [freq], [1.3], [shape], phases=[phase], engine="ifft")
+                analytic_sig = 1.3 * analytic(freq, phase=phase)
+                diff = builder.signal - analytic_sig
+                assert abs(diff).mean() < tolerance, 'at %s for %s' % (freq, shape)
+
+    freqs, amps, phases = [2., 30., 60.], [1., .5, .2], [0., 90., 12.]
+    shapes = ['square', 'sawtooth', 'triangle']
+    series = SignalBuilder(
+        freqs, amps, shapes, phases=phases, n_max=100, interpolation="cubic")
+    ifft = SignalBuilder(
+        freqs, amps, shapes, phases=phases, n_max=100, engine="ifft")
+    assert ifft.signal.shape == series.signal.shape
+    assert abs(ifft.signal - series.signal).max() < 1e-8
+
+
+def test_nyquist_guard():
+    builder = SignalBuilder(
+        [1000.], [1.], ['square'], nyquist_guard=0, interpolation="cubic")
+    terms, coefficients = builder._series_terms(1000., 'square')
+    assert list(terms) == list(range(1, 23, 2))
+    assert (coefficients != 0).all()
+    terms, _ = builder._series_terms(1000., 'sine')
+    assert list(terms) == [1]
+
+    guarded = SignalBuilder([1000.], [1.], ['square'], nyquist_guard=.5)
+    terms, _ = guarded._series_terms(1000., 'square')
+    assert list(terms) == list(range(1, 12, 2))
+
+    # below Nyquist the series matches the band-limited ifft rendering
+    ifft = SignalBuilder([1000.], [1.], ['square'], engine="ifft")
+    assert abs(builder.signal - ifft.signal).max() < 1e-8
+
+
+def test_shared_wavetables():
+    WAVETABLES.clear()
+    shapes = ['square', 'sawtooth']
+    first = SignalBuilder([110.3, 220.7], [1., .4], shapes, n_max=50).render()
+    assert len(WAVETABLES) == 2
+    # new pitches and amplitudes of the same timbres reuse the tables
+    second = SignalBuilder([130.1, 261.9], [.2, 1.5], shapes, n_max=50).render()
+    assert len(WAVETABLES) == 2
+    assert first.n_samples == second.n_samples
+
+    for freq, amp, (analytic, shape, tolerance) in zip(
+            [3.1, 7.9], [.2, 1.5], WAVES[1:3]):
+        builder = SignalBuilder([freq], [amp], [shape])
+        diff = builder.signal - amp * analytic(freq)
+        assert abs(diff).mean() < tolerance
+
+
+def test_streaming_export(testfile_path):
+    freqs, amps, shapes = [110.3, 220.7, 3.1], [1., .4, .8], ['square', 'sine', 'triangle']
+    streamed = SignalBuilder(freqs, amps, shapes, duration=1.3)
+    blocks = list(streamed.iter_blocks(10000))
+    assert streamed._signal is None
+    assert [b.size for b in blocks] == [10000] * 5 + [7330]
+
+    rendered = SignalBuilder(freqs, amps, shapes, duration=1.3)
+    assert np.array_equal(np.concatenate(blocks), rendered.signal)
+    assert streamed.peak(4096) == np.max(np.abs(rendered.signal))
+    assert streamed.peak_bound() >= streamed.peak()
+
+    rendered.export(testfile_path)
+    in_memory, _ = load_audio(testfile_path)
+    streamed.export(testfile_path, block_size=4096)
+    assert streamed._signal is None
+    from_blocks, samplerate = load_audio(testfile_path)
+    assert samplerate == streamed.samplerate
+    assert np.array_equal(in_memory, from_blocks)
+
+    streamed.export(testfile_path, peak_bound=True)
+    bounded, _ = load_audio(testfile_path)
+    assert np.max(np.abs(bounded)) <= 1.
+    assert abs(np.max(np.abs(bounded)) * streamed.peak_bound()
+               - streamed.peak()) < 1e-3
+
+
+def test_cubic_peak_bound(testfile_path):
+    # cubic interpolation of the square wave ringing overshoots the table
+    builder = SignalBuilder(
+        [110.3], [1.], ['square'], n_max=200, table_size=8,
+        interpolation='cubic'
+    )
+    table = builder._oscillators()[0][0]
+    assert builder.peak() > np.max(np.abs(table))
+    assert builder.peak_bound() >= builder.peak()
+
+    builder.export(testfile_path, peak_bound=True)
+    bounded, _ = load_audio(testfile_path)
+    assert np.max(np.abs(bounded)) <= 1.
+    assert builder._signal is None
+
+def test_workers(monkeypatch, empty_caches):
+    freqs = [55. * (i + 1) + .3 for i in range(12)]
+    amps = [1. / (i + 1) for i in range(12)]
+    shapes = [WAVE_LABELS[i % 4] for i in range(12)]
+    # a single worker renders in the calling thread, without a pool
+    with monkeypatch.context() as patch:
+        patch.setattr(signal_builder, "ThreadPoolExecutor", None)
+        single = SignalBuilder(freqs, amps, shapes, n_max=200)
+        reference = single.signal
+        assert single.peak() == np.max(np.abs(reference))
+        assert np.array_equal(reference, np.concatenate(list(
+            SignalBuilder(freqs, amps, shapes, n_max=200).iter_blocks(5000))))
+
+    # Without clearing, every builder below would read the components
+    # cached by the single-threaded render.
+    for workers in (4, None):
+        CACHE.clear()
+        WAVETABLES.clear()
+        parallel = SignalBuilder(
+            freqs, amps, shapes, n_max=200, workers=workers
+        )
+        with profile() as metrics:
+            assert np.array_equal(reference, parallel.signal)
+        assert metrics.spans["synth.component"][0] == len(freqs)
+
+    CACHE.clear()
+    WAVETABLES.clear()
+    streamed = SignalBuilder(freqs, amps, shapes, n_max=200, workers=None)
+    blocks = np.concatenate(list(streamed.iter_blocks(5000)))
+    assert np.array_equal(reference, blocks)
+
+
+def test_backends(monkeypatch, tmp_path, empty_caches):
+    freqs, amps, waves = [110., 330.5], [1., .5], ['square', 'triangle']
+    reference = SignalBuilder(
+        freqs, amps, waves, n_max=100, duration=.5, backend="cython").signal
+    for backend in backends.available_backends():
+        # the cache keys do not name the backend: render from scratch
+        CACHE.clear()
+        WAVETABLES.clear()
+        with profile() as metrics:
+            s = SignalBuilder(freqs, amps, waves, n_max=100, duration=.5, backend=backend)
+            signal = s.signal
+        assert metrics.spans["synth.component"][0] == 2
+        assert s.backend == backend
+        assert np.allclose(signal, reference, rtol=0, atol=1e-9)
+    assert SignalBuilder(freqs, amps, waves, backend="ifft").engine == "ifft"
+
+    monkeypatch.setenv("SOUNDFACTORY_BACKEND", "numpy")
+    assert SignalBuilder(freqs, amps, waves).backend == "numpy"
+
+    # auto benchmarks once and remembers the winner
+    path = str(tmp_path / "backend.json")
+    fastest = backends.fastest_backend(path=path)
+    assert fastest in backends.available_backends()
+    with open(path) as f:
+        assert json.load(f) == {backends.machine_id(): fastest}
+    backends._FASTEST.clear()
+    monkeypatch.setattr(backends, "benchmark_backend", None)
+    assert backends.fastest_backend(path=path) == fastest
+    monkeypatch.undo()
+
+    # a path that can not be written, as in a read-only install, keeps
+    # the choice for the process only
+    unwritable = str(tmp_path)
+    assert backends.fastest_backend(path=unwritable) in backends.available_backends()
+    assert (backends.machine_id(), unwritable) in backends._FASTEST
+    backends._FASTEST.clear()
+
+
+def test_float32(testfile_path):
+    freqs = [55. + 97.3 * i for i in range(12)]
+    amps = [random() for _ in freqs]
+    waves = WAVE_LABELS * 3
+    phases = [random() * 360 for _ in freqs]
+    for engine in ["series", "ifft"]:
+        double, single = (
+            SignalBuilder(
+                freqs, amps, waves, phases=phases, n_max=200,
+                engine=engine, dtype=dtype)
+            for dtype in ["float64", "float32"]
+        )
+        assert single.scaled_signal.dtype == np.float32
+        assert double.scaled_signal.dtype == np.float64
+        assert np.abs(single.scaled_signal - double.scaled_signal).max() \
+            < FLOAT32_TOLERANCE
+    blocks = list(SignalBuilder(
+        freqs, amps, waves, n_max=200, dtype="float32").iter_blocks(10000))
+    assert all(block.dtype == np.float32 for block in blocks)
+    single.export(testfile_path, block_size=10000)
+    exported, _ = load_audio(testfile_path)
+    assert np.abs(exported - double.scaled_signal).max() < 2 ** -14
+
+
+def test_loop(monkeypatch, testfile_path):
+    freqs, amps, waves = [110., 165., 220.5], [1., .5, .3], ['square', 'sawtooth', 'triangle']
+    looped = SignalBuilder(freqs, amps, waves, n_max=100, duration=5, loop=True)
+    assert looped.loop_length == 2 * DEFAULT_SAMPLERATE
+    full = SignalBuilder(freqs, amps, waves, n_max=100, duration=5)
+    assert full.loop_length is None
+    assert np.allclose(looped.signal, full.signal, rtol=0, atol=1e-8)
+    blocks = np.concatenate(list(SignalBuilder(
+        freqs, amps, waves, n_max=100, duration=5, loop=True).iter_blocks(30000)))
+    assert np.array_equal(blocks, looped.signal)
+    looped.export(testfile_path)
+    assert read_loop_points(testfile_path) == [(0, 2 * DEFAULT_SAMPLERATE - 1)]
+    exported, _ = load_audio(testfile_path)
+    assert exported.shape[0] == 5 * DEFAULT_SAMPLERATE
+    # an irrational frequency ratio does not repeat within the duration
+    irrational = SignalBuilder(
+        [100., 100 * 2 ** .5], [1., 1.], ['sine', 'sine'], loop=True)
+    assert irrational.loop_length is None
+
+    # the loop is searched once per builder, found or not
+    searches = []
+
+    def search(*args, **kwargs):
+        searches.append(args)
+        return loop_length(*args, **kwargs)
+
+    monkeypatch.setattr(signal_builder, "loop_length", search)
+    looped = SignalBuilder(freqs, amps, waves, n_max=100, duration=5, loop=True)
+    looped.export(testfile_path, block_size=30000)
+    assert looped.loop_length == 2 * DEFAULT_SAMPLERATE
+    irrational.loop_length
+    irrational.export(testfile_path, block_size=30000)
+    assert len(searches) == 1
+
+
+def test_profile(empty_caches, testfile_path):
+    with profile() as metrics:
+        s = SignalBuilder([440., 660.], [1., .5], ['sine', 'square'], duration=.1)
+        s.render()
+        s.export(testfile_path)
+    report = metrics.report()
+    assert {"synth", "cache.lookup", "export"} <= set(report["spans"])
+    assert report["spans"]["synth"]["calls"] == 1
+    counters = report["counters"]
+    # a wavetable and a component lookup per component, and another
+    # wavetable lookup for each component rendered (not found on disk)
+    assert report["spans"]["synth.component"]["calls"] == 2
+    assert counters["cache.hits"] + counters["cache.misses"] == 6
+    assert counters["bytes.signal"] == s.signal.nbytes
+    assert json.loads(json.dumps(report)) == report
+    # nothing is recorded outside of the block
+    SignalBuilder([440.], [1.], ['sine'], duration=.1).render()
+    assert metrics.report() == report
+
+
+def test_warm(empty_caches, testfile_path):
+    warm("A4", 440., 5, ["sine", "square"], [50], [8000], .2, workers=2)
+    # as in a new process, only what is on disk is left
+    CACHE.memory.clear()
+    WAVETABLES.memory.clear()
+    freqs = list(build_24_tet_scale("A4", 440., max_octave=5).values())[::7][:3]
+    shapes = ["sine", "square", "sine"]
+
+    # the components are cached at unit amplitude
+    with profile() as metrics:
+        SignalBuilder(
+            freqs, [.5, .2, .9], shapes, n_max=50, samplerate=8000, duration=.2
+        ).render()
+    assert metrics.counters["cache.misses"] == 0
+    assert "synth.component" not in metrics.spans
+
+    # the wavetables serve other phases, and streamed exports
+    with profile() as metrics:
+        SignalBuilder(
+            freqs, [.5, .2, .9], shapes, phases=[90., 0., 45.],
+            n_max=50, samplerate=8000, duration=.2
+        ).export(testfile_path, block_size=400)
+    assert metrics.counters["cache.misses"] == 0
+    assert metrics.counters["cache.hits"] == 2
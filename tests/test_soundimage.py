@@ -1,8 +1,10 @@
 from soundfactory.image_base import (
     COLORSPACE,
+    BUILDER_CACHE,
     SoundImage,
     Channel
 )
+from soundfactory.signal_builder import RenderedSignal
 import numpy as np
 from PIL import ImageChops
 from itertools import combinations
@@ -62,3 +64,20 @@ def test_class(rgb_file):
         assert Path(
             Path(__file__).parent.parent / folder / str(l + r + '.wav')
         ).is_file()
+
+
+def test_audio_signal(rgb_file, tmp_path):
+    channel = SoundImage(rgb_file, resolution=4).channels["R"]
+    kw = dict(n_max=10, samplerate=8000, duration=.5)
+    rendered = channel.audio_signal(5, **kw)
+    assert isinstance(rendered, RenderedSignal)
+    assert rendered.samplerate == 8000 and rendered.duration == .5
+    assert rendered.n_samples == rendered.time_space.shape[0] == 4000
+    assert np.isclose(np.max(np.abs(rendered.scaled_signal)), 1.)
+    # only the normalized array is stored, read back memory mapped
+    BUILDER_CACHE.memory.clear()
+    cached = channel.audio_signal(5, **kw)
+    assert isinstance(cached.scaled_signal, np.memmap)
+    assert np.array_equal(cached.scaled_signal, rendered.scaled_signal)
+    cached.export(str(tmp_path / "R.wav"))
+    assert (tmp_path / "R.wav").is_file()
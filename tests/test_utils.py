@@ -1,5 +1,12 @@
+import pytest
 import numpy as np
+import soundfile as sf
 from soundfactory.utils.helpers import (
+    quantize,
+    spectrum,
+    welch_spectrum,
+    single_component_cache_key,
+    builder_cache_key,
     cents_from_freq_ratio,
     freq_at_n_semitones,
     freq_at_n_quartertones
@@ -10,12 +17,18 @@ from soundfactory.constants import (
 )
 from soundfactory.settings.plot import TONE_FREQ_MAP
 from soundfactory.utils.signal import (
-    freq_indexes, build_fft, write_stereo, load_audio
+    freq_indexes, build_fft, build_signal, build_real_signal,
+    write_stereo, load_audio, loop_length, wav_layout
+)
+from multiprocessing import get_context
+from soundfactory.utils.cache import (
+    CacheStore, SQLiteCacheStore, TieredCache, memory_cache
 )
 from soundfactory.utils.scale import (
-    next_label, next_freq, build_24_tet_scale, build_24_tet_scale_by_sequence
+    next_label, next_freq, build_24_tet_scale, build_24_tet_scale_by_sequence,
+    edo_scale
 )
-from soundfactory.utils.labels import remove_close_values_on_log_scale
+from soundfactory.utils.labels import remove_close_values_on_log_scale, hz_to_note
 from pathlib import Path
 
 
@@ -71,6 +84,25 @@ def test_build_fft(signals):
         _test_case(signal, samplerate)
 
 
+def test_build_real_signal(lengths_samplerates):
+    for n, samplerate in lengths_samplerates:
+        period = n / samplerate
+        freqs = np.fft.rfftfreq(n, d=1/samplerate)[:(n-1)//2 + 1]
+        amps = np.random.random(freqs.size)
+        phases = np.random.uniform(-np.pi, np.pi, freqs.size)
+        phases[0] = 0
+        sig = build_real_signal(freqs, amps, phases, period, samplerate)
+        ref = build_signal(freqs, amps, phases, period, samplerate)
+        assert sig.size == ref.size
+        assert (np.abs(sig - ref.real) < 1e-8).all()
+
+    # components on the same bin add up
+    single = build_real_signal([10.], [1.], [0.], period=1, samplerate=100)
+    double = build_real_signal(
+        [10., 10.], [1., 1.], [0., 0.], period=1, samplerate=100)
+    assert (np.abs(double - 2 * single) < 1e-12).all()
+
+
 def test_24_scale_builder():
 
     def repeat(foo, n, x):
@@ -159,3 +191,275 @@ def test_write_stereo(mono_audio_file):
     Path(out).unlink()
     assert (c1 == left).all()
     assert (c2 == right).all()
+
+
+def test_load_audio_window(tmp_path, stereo_audio_file):
+    full, samplerate = load_audio(stereo_audio_file)
+    window, _ = load_audio(stereo_audio_file, start=1., end=1.5)
+    assert np.array_equal(window, full[samplerate:samplerate + samplerate // 2])
+    with pytest.raises(ValueError):
+        load_audio(stereo_audio_file, start=1., end=.5)
+
+    samples = np.random.uniform(-1, 1, (1000, 2)).astype(np.float32)
+    for subtype in ('PCM_U8', 'PCM_16', 'PCM_24', 'PCM_32', 'FLOAT', 'DOUBLE'):
+        path = str(tmp_path / (subtype + '.wav'))
+        sf.write(path, samples, 8000, subtype=subtype)
+        # 24 bits samples can not be mapped as an array
+        assert (wav_layout(path) is None) == (subtype == 'PCM_24')
+        read, _ = load_audio(path, start=.01, end=.1)
+        mapped, _ = load_audio(path, start=.01, end=.1, mmap=True)
+        assert mapped.dtype == np.float32 and mapped.shape == (720, 2)
+        assert np.array_equal(read, mapped)
+    mapped, _ = load_audio(str(tmp_path / 'FLOAT.wav'), mmap=True)
+    assert isinstance(mapped, np.memmap)
+
+
+def test_welch_spectrum():
+    samplerate = 8000
+    t = np.arange(3 * samplerate) / samplerate
+    sig = .8 * np.sin(2 * np.pi * 1000 * t)
+    freqs, pws = welch_spectrum([sig], samplerate, nperseg=1024)
+    assert freqs.size == pws.size == 512
+    assert np.isclose(freqs[1], samplerate / 1024)
+    # peaks at the same power as a single fft
+    assert np.isclose(freqs[pws.argmax()], 1000.)
+    assert np.isclose(pws.max(), spectrum(sig, samplerate)[1].max(), rtol=1e-3)
+
+    # the same from blocks of any size, for each channel
+    stereo = np.stack([sig, sig / 2], axis=1)
+    blocks = [stereo[i:i + 777] for i in range(0, len(stereo), 777)]
+    _, stereo_pws = welch_spectrum(blocks, samplerate, nperseg=1024)
+    assert stereo_pws.shape == (512, 2)
+    assert np.allclose(stereo_pws[:, 0], pws)
+    assert np.allclose(stereo_pws[:, 1], pws / 4)
+
+    # a short signal is a single segment
+    freqs, pws = welch_spectrum([sig[:300]], samplerate, nperseg=1024)
+    assert freqs.size == pws.size == 150
+
+
+def test_loop_length():
+    assert loop_length([440.], 44100, 44100) == 2205
+    assert loop_length([440., 660.], 44100, 44100) == 2205
+    assert loop_length([123.45], 44100, 10 ** 6) == 294000
+    assert loop_length([123.45], 44100, 44100) is None
+    # 100 * sqrt(2) is within 1e-6 cycles of a whole number after 137207 samples
+    assert loop_length([100 * 2 ** .5], 44100, 10 ** 6) == 137207
+    assert loop_length([100 * 2 ** .5], 44100, 10 ** 6, tolerance=1e-9) is None
+
+
+def test_cache_store(tmp_path):
+    store = CacheStore(tmp_path / "cache")
+    assert store.get("missing") is None
+    signal = np.linspace(-1, 1, 1000)
+    store["signal"] = signal
+    store["object"] = {"freqs": [110., 220.]}
+    files = sorted(p.suffix for p in (tmp_path / "cache").iterdir())
+    assert files == ["", ".jsonl", ".npy", ".pickle"]
+    # a new store, e.g. in another process, finds the entries in the index
+    reopened = CacheStore(tmp_path / "cache")
+    assert reopened._index is None
+    assert np.array_equal(reopened["signal"], signal)
+    assert isinstance(reopened["signal"], np.memmap)
+    assert not reopened["signal"].flags.writeable
+    assert not isinstance(
+        CacheStore(tmp_path / "cache", mmap=False)["signal"], np.memmap)
+    assert reopened["object"] == {"freqs": [110., 220.]}
+    store["later"] = signal * 2
+    assert np.array_equal(reopened["later"], signal * 2)
+    del store["signal"]
+    assert "signal" not in store and len(store) == 2
+    # an interrupted index write does not lose the other entries
+    with open(store.index_path, "a") as f:
+        f.write('{"key": "broken", "fi')
+    store["after"] = signal
+    reloaded = CacheStore(tmp_path / "cache")
+    assert sorted(reloaded) == ["after", "later", "object"]
+    reloaded.compact()
+    assert len(CacheStore(tmp_path / "cache")) == 3
+
+
+def test_cache_compact(tmp_path):
+    entry = np.zeros(1000)
+    store = CacheStore(tmp_path / "cache")
+    other = CacheStore(tmp_path / "cache")
+    for key in "abcdefgh":
+        store[key] = entry
+    assert len(other) == 8
+    for key in "abcdef":
+        del store[key]
+    store.compact()
+    # the other store has read past the end of the compacted index
+    assert other._offset > store.index_path.stat().st_size
+    store["i"] = entry
+    del store["g"]
+    # a miss reads the index again
+    assert np.array_equal(other["i"], entry)
+    assert sorted(other) == ["h", "i"]
+    assert other.nbytes() == store.nbytes() == 2 * (entry.nbytes + 128)
+    # and keeps following the appends once the index is longer again
+    for key in "jklmnopq":
+        store[key] = entry
+    del store["h"]
+    other.refresh()
+    assert sorted(other) == sorted("ijklmnopq")
+    assert other.nbytes() == store.nbytes()
+
+def test_cache_eviction(tmp_path):
+    entry = np.zeros(1000)
+    size = entry.nbytes + 128  # .npy header
+    for store_class in [CacheStore, SQLiteCacheStore]:
+        for policy, evicted in [("lru", "c"), ("lfu", "b"), ("ttl", "a")]:
+            path = tmp_path / store_class.__name__ / policy
+            store = store_class(path, max_bytes=3 * size, policy=policy, ttl=60)
+            for key in "abc":
+                store[key] = entry
+            store["c"], store["c"], store["b"], store["a"]
+            store["d"] = entry
+            assert sorted(store) == sorted(set("abcd") - {evicted})
+            assert store.nbytes() <= 3 * size
+            assert store.stats["evictions"] == 1
+            assert len(list(path.glob("*.npy"))) == 3
+        store = store_class(tmp_path / store_class.__name__ / "expired", policy="ttl", ttl=0)
+        store["a"] = entry
+        assert store.get("a") is None
+        assert store.stats["expirations"] == 1
+
+    cache = TieredCache(
+        memory_cache("lru", max_bytes=2 * entry.nbytes),
+        CacheStore(tmp_path / "tiered", max_bytes=10 * size)
+    )
+    for key in "abc":
+        cache[key] = entry
+    # a is no more in memory, but still on disk
+    assert np.array_equal(cache["a"], entry)
+    stats = cache.stats
+    assert stats["memory"]["evictions"] == 2
+    assert stats["memory"]["misses"] == 1
+    assert stats["memory"]["bytes"] == 2 * entry.nbytes
+    assert stats["disk"]["hits"] == 1 and stats["disk"]["evictions"] == 0
+    # the counts of each run add up in the store
+    cache.save_stats()
+    cache["a"], cache.get("missing")
+    cache.save_stats()
+    saved = cache.store.saved_stats()
+    assert saved["memory"]["hits"] == 1 and saved["memory"]["misses"] == 2
+    assert saved["disk"]["hits"] == 1 and saved["disk"]["misses"] == 1
+
+
+def test_cache_prune(tmp_path):
+    entry = np.zeros(1000)
+    size = entry.nbytes + 128
+    for store_class in [CacheStore, SQLiteCacheStore]:
+        store = store_class(tmp_path / store_class.__name__, policy="ttl")
+        for key in "abcd":
+            store[key] = entry
+        store._insert({"key": "a", "file": store.index["a"]["file"], "bytes": size, "time": 0.})
+        assert store.prune(max_age=3600) == 1
+        assert sorted(store) == ["b", "c", "d"]
+        # then the oldest ones go, as with the ttl policy
+        assert store.prune(max_bytes=size) == 2
+        assert list(store) == ["d"] and store.nbytes() == size
+        assert len(list(store.path.glob("*.npy"))) == 1
+
+
+def test_prune_command(monkeypatch, tmp_path):
+    from soundfactory import cache
+    entry = np.zeros(1000)
+    size = entry.nbytes + 128
+    path = tmp_path / "components"
+    monkeypatch.setattr(cache, "CACHE_DIRS", {"components": str(path)})
+    writer = CacheStore(path)
+    for key in "abcdefgh":
+        writer[key] = entry
+    # another process keeps using the store across the compaction
+    other = CacheStore(path)
+    assert len(other) == 8
+    before = writer.index_path.stat().st_size
+    cache.prune(max_bytes=2 * size)
+    assert writer.index_path.stat().st_size < before
+    writer["i"] = entry
+    del writer["h"]
+    assert np.array_equal(other["i"], entry)
+    assert sorted(other) == ["g", "i"]
+    assert other.nbytes() == 2 * size
+
+def _fill_cache(args):
+    store_class, path, worker = args
+    store = store_class(path, max_bytes=40 * 8128)
+    for i in range(20):
+        store["{}_{}".format(worker, i)] = np.full(1000, worker, dtype=np.float64)
+        store.get("0_{}".format(i))
+    return store.stats["evictions"]
+
+
+def test_cache_processes(tmp_path):
+    for store_class in [CacheStore, SQLiteCacheStore]:
+        path = tmp_path / store_class.__name__
+        with get_context("fork").Pool(4) as pool:
+            evictions = sum(pool.map(
+                _fill_cache, [(store_class, path, w) for w in range(4)]))
+        store = store_class(path)
+        # 80 entries written, 40 fit: the others have been evicted
+        assert len(store) == 40 and evictions == 40
+        assert store.nbytes() == 40 * 8128
+        assert len(list(path.glob("*.npy"))) == 40
+        assert not list(path.glob("*.tmp"))
+        for key in store:
+            assert store[key][0] == int(key.split("_")[0])
+
+
+def test_cache_keys():
+    key = single_component_cache_key(
+        None, 440., 0., 'sine', 100, 44100, 1., None, 65536, 'linear', 'float64')
+    assert len(key) == 32
+    assert key == single_component_cache_key(
+        None, np.float64(440.00000001), 360., 'sine', np.int64(100), 44100.,
+        1, None, 65536, 'linear', np.dtype('float64'))
+    assert key != single_component_cache_key(
+        None, 440.01, 0., 'sine', 100, 44100, 1., None, 65536, 'linear', 'float64')
+    assert builder_cache_key(
+        [110., 220.], [1., .5], ['sine', 'square'], None, 100, 44100, 1.
+    ) == builder_cache_key(
+        np.array([220., 110.]), np.array([.5, 1.]), ['square', 'sine'], [0., 0.], 100, 44100, 1
+    )
+    # the same notes computed along different paths hit the same keys
+    rng = np.random.default_rng(0)
+    notes = rng.integers(0, 48, 200)
+    direct = [55. * 2 ** (n / 12) for n in notes]
+    stepped = [55. * np.prod([2 ** (1 / 12)] * n) for n in notes]
+    assert sum(str(a) == str(b) for a, b in zip(direct, stepped)) < 50
+    assert all(
+        quantize(a, 1e-6) == quantize(b, 1e-6) for a, b in zip(direct, stepped))
+
+
+def test_hz_to_note():
+    scale = build_24_tet_scale_by_sequence('A-1', A_SUB_SUB_CONTRA_FREQ)
+    freqs = np.array(list(scale.values()))
+    assert hz_to_note(freqs).tolist() == list(scale.keys())
+    assert hz_to_note(440.) == 'A4'
+    # out of the scale, the closest end
+    assert hz_to_note([1., 1e6]).tolist() == ['A-1', 'G10']
+    # slightly off notes
+    assert hz_to_note(freqs[1:-1] * 2 ** (1 / 96)).tolist() == list(scale.keys())[1:-1]
+
+
+def test_edo_scale():
+    labels, freqs = edo_scale(12)
+    assert freqs[labels.tolist().index('A4')] == 440.
+    assert np.isclose(freqs[labels.tolist().index('C4')], 261.6256, atol=1e-4)
+    assert labels[:3].tolist() == ['C-1', 'C-1#', 'D-1']
+    assert len(labels) == 12 * 12
+    # the same notes as the step by step 24-TET scale, without its rounding
+    scale = build_24_tet_scale_by_sequence('A-1', A_SUB_SUB_CONTRA_FREQ)
+    labels, freqs = edo_scale(24, 'A-1', A_SUB_SUB_CONTRA_FREQ)
+    first = labels.tolist().index('A-1')
+    assert labels[first:first + len(scale)].tolist() == list(scale.keys())
+    assert np.allclose(freqs[first:first + len(scale)], list(scale.values()), rtol=1e-3)
+    for edo in (31, 53):
+        labels, freqs = edo_scale(edo, min_octave=4, max_octave=5)
+        assert labels[0] == 'C4+0' and labels[-1] == 'C5+{}'.format(edo - 1)
+        assert np.allclose(freqs[1:] / freqs[:-1], 2 ** (1 / edo))
+    # memoized, and read-only since shared
+    assert edo_scale(53, min_octave=4, max_octave=5)[1] is freqs
+    assert not freqs.flags.writeable